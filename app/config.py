@@ -1,27 +1,54 @@
 """
 Application configuration loaded from environment variables.
 """
-from pydantic_settings import BaseSettings
+from pydantic_settings import BaseSettings, SettingsConfigDict
 from functools import lru_cache
+from typing import Optional
 
 
 class Settings(BaseSettings):
     DATABASE_URL: str = "sqlite://"
+    # Optional PostgreSQL replica for the read-only endpoints (balance,
+    # history, catalog lists); unset sends them to DATABASE_URL.
+    DATABASE_READ_URL: Optional[str] = None
     DB_ECHO: bool = False          
+    # Per worker process; keep workers * (pool size + overflow) under the
+    # server's max_connections.
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    DB_STATEMENT_TIMEOUT_MS: int = 5000    # PostgreSQL only; 0 disables
+    # Disable when the schema is managed by migrations.
+    RUN_CREATE_ALL: bool = True
 
     APP_NAME: str = "Wallet Service"
     APP_VERSION: str = "1.0.0"
     DEBUG: bool = False
+    # Worker threads available to sync endpoints (AnyIO's default is 40).
+    THREADPOOL_TOKENS: int = 100
 
     IDEMPOTENCY_KEY_TTL_HOURS: int = 24
+    IDEMPOTENCY_PURGE_INTERVAL_MINUTES: int = 60
+    # Completed keys remembered per process, in front of Redis and the table.
+    IDEMPOTENCY_LOCAL_CACHE_MAX_ENTRIES: int = 10_000
+    # Optional Redis in front of idempotency_keys, e.g. redis://localhost:6379/0
+    REDIS_URL: Optional[str] = None
+
+    SQLITE_MAINTENANCE_INTERVAL_MINUTES: int = 15
+
+    # Rows the revenue wallet of each asset is spread across; purchases pick
+    # one by user id so concurrent spends rarely wait on the same row.
+    SYSTEM_WALLET_SHARDS: int = 32
+
+    CATALOG_CACHE_TTL_SECONDS: int = 60
 
     JWT_SECRET: str = "change-me-in-production"
     JWT_ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
+    JWT_CACHE_TTL_SECONDS: int = 300
+    JWT_CACHE_MAX_ENTRIES: int = 10_000
 
-    class Config:
-        env_file = ".env"
-        env_file_encoding = "utf-8"
+    model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", frozen=True)
 
 
 @lru_cache()
@@ -1,50 +1,168 @@
-from sqlalchemy import create_engine, event
-from sqlalchemy.orm import sessionmaker, Session
+import hashlib
+import threading
+from contextvars import ContextVar
+from typing import Optional
+
+import orjson
+from sqlalchemy import (
+    Column, MetaData, String, Table, create_engine, delete, event, insert, select, text,
+)
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import CreateIndex, CreateTable
+from sqlalchemy.orm import scoped_session, sessionmaker, Session
+from sqlalchemy.pool import QueuePool
 from contextlib import contextmanager
 from app.config import settings
 
-_connect_args = {}
-if settings.DATABASE_URL.startswith("sqlite"):
-    _connect_args["check_same_thread"] = False
-
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args=_connect_args,
-    pool_pre_ping=True,
-    echo=settings.DB_ECHO,
-    **({} if settings.DATABASE_URL.startswith("sqlite") else {
-        "pool_size": 20,
-        "max_overflow": 10,
-        "pool_recycle": 1800,
-    })
-)
+# Read once at import; settings are frozen, so these never go stale.
+_DB_URL = settings.DATABASE_URL
+_DB_ECHO = settings.DB_ECHO
+_IS_SQLITE = _DB_URL.startswith("sqlite")
+_IS_SQLITE_MEMORY = _IS_SQLITE and make_url(_DB_URL).database in (None, "", ":memory:")
 
-if settings.DATABASE_URL.startswith("sqlite"):
-    @event.listens_for(engine, "connect")
-    def set_sqlite_pragma(dbapi_conn, connection_record):
-        cursor = dbapi_conn.cursor()
-        cursor.execute("PRAGMA journal_mode=WAL")
-        cursor.execute("PRAGMA foreign_keys=ON")
-        cursor.close()
 
-SessionLocal = sessionmaker(
-    bind=engine,
-    autocommit=False,
-    autoflush=False,
+def _set_sqlite_pragma(dbapi_conn, connection_record):
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    # Per-connection settings: WAL makes NORMAL crash-safe, and busy_timeout
+    # lets concurrent writers queue instead of failing with SQLITE_BUSY.
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=30000")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-64000")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+def _set_sqlite_reader_pragma(dbapi_conn, connection_record):
+    _set_sqlite_pragma(dbapi_conn, connection_record)
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+
+if _IS_SQLITE:
+    # SQLite allows a single writer at a time, so all writes go through one
+    # pooled connection while reads get their own pool and run in parallel
+    # under WAL. A session holds that connection only from its first
+    # statement to commit/rollback; others wait for it in the pool (up to the
+    # same 30s as busy_timeout), never while a request is merely scheduled.
+    # An in-memory database only exists on the connection that created it,
+    # so there the reader shares the writer.
+    writer_engine = create_engine(
+        _DB_URL,
+        connect_args={"check_same_thread": False},
+        poolclass=QueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=30,
+        echo=_DB_ECHO,
+    )
+    event.listen(writer_engine, "connect", _set_sqlite_pragma)
+
+    if _IS_SQLITE_MEMORY:
+        reader_engine = writer_engine
+    else:
+        reader_engine = create_engine(
+            _DB_URL,
+            connect_args={"check_same_thread": False},
+            poolclass=QueuePool,
+            pool_size=settings.DB_POOL_SIZE,
+            echo=_DB_ECHO,
+        )
+        event.listen(reader_engine, "connect", _set_sqlite_reader_pragma)
+else:
+    # JSONB columns are (de)serialised by the driver layer; use orjson there too.
+    # insertmanyvalues folds ledger executemany batches into multi-row VALUES;
+    # values_plus_batch also sends UPDATE/DELETE executemany through
+    # psycopg2's execute_batch instead of one statement per row.
+    _pg_engine_args = dict(
+        pool_pre_ping=True,
+        use_insertmanyvalues=True,
+        insertmanyvalues_page_size=1000,
+        executemany_mode="values_plus_batch",
+        executemany_batch_page_size=500,
+        echo=_DB_ECHO,
+        json_serializer=lambda obj: orjson.dumps(obj, default=str).decode(),
+        json_deserializer=orjson.loads,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+        connect_args=(
+            {"options": f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}"}
+            if settings.DB_STATEMENT_TIMEOUT_MS else {}
+        ),
+    )
+    writer_engine = create_engine(_DB_URL, **_pg_engine_args)
+
+    if settings.DATABASE_READ_URL:
+        # Read-only endpoints go to the replica through their own pool.
+        # psycopg2 applies readonly by opening each transaction with
+        # BEGIN READ ONLY, so no session state is left on the server
+        # connection and it is safe behind PgBouncer transaction pooling.
+        reader_engine = create_engine(
+            settings.DATABASE_READ_URL, **_pg_engine_args
+        ).execution_options(postgresql_readonly=True)
+    else:
+        reader_engine = writer_engine
+
+engine = writer_engine
+
+# Sessions are scoped to the HTTP request (see request_session_scope, installed
+# as middleware in app.main); outside a request they fall back to the thread.
+_request_scope: ContextVar[Optional[object]] = ContextVar("db_request_scope", default=None)
+
+
+def _session_scope():
+    scope = _request_scope.get()
+    return scope if scope is not None else threading.get_ident()
+
+
+WriterSession = scoped_session(
+    sessionmaker(bind=writer_engine, autocommit=False, autoflush=False),
+    scopefunc=_session_scope,
 )
 
+ReaderSession = scoped_session(
+    sessionmaker(bind=reader_engine, autocommit=False, autoflush=False),
+    scopefunc=_session_scope,
+)
+
+
+@contextmanager
+def request_session_scope():
+    token = _request_scope.set(object())
+    try:
+        yield
+    finally:
+        WriterSession.remove()
+        ReaderSession.remove()
+        _request_scope.reset(token)
+
 
 def get_db() -> Session:
-    db = SessionLocal()
+    db = WriterSession()
     try:
         yield db
+    except Exception:
+        db.rollback()
+        raise
     finally:
-        db.close()
+        WriterSession.remove()
+
+
+def get_db_read() -> Session:
+    try:
+        yield ReaderSession()
+    finally:
+        ReaderSession.remove()
 
 
 @contextmanager
 def get_db_context() -> Session:
-    db = SessionLocal()
+    db = WriterSession.session_factory()
     try:
         yield db
         db.commit()
@@ -53,3 +171,76 @@ def get_db_context() -> Session:
         raise
     finally:
         db.close()
+
+
+@contextmanager
+def relaxed_commit(db: Session):
+    """
+    Commit without waiting for the WAL to reach disk.
+
+    Only for work a crash can safely lose, e.g. idempotency-key housekeeping:
+    a lost commit is redone by the next run or client retry.
+    """
+    if _IS_SQLITE:
+        db.connection().exec_driver_sql("PRAGMA synchronous=OFF")
+        try:
+            yield db
+            db.commit()
+        except BaseException:
+            # A failed session cannot run the restore below until rolled back;
+            # the writer pool has one connection, so it lands on the same one.
+            db.rollback()
+            raise
+        finally:
+            db.connection().exec_driver_sql("PRAGMA synchronous=NORMAL")
+    else:
+        db.execute(text("SET LOCAL synchronous_commit = off"))
+        yield db
+        db.commit()
+
+
+# Records the hash of the DDL the schema was last created from, so worker
+# processes can skip create_all() (and its catalog round-trips) on boot.
+_schema_version = Table(
+    "_schema_version",
+    MetaData(),
+    Column("schema_hash", String(64), primary_key=True),
+)
+
+
+def schema_hash(metadata: MetaData) -> str:
+    digest = hashlib.sha256()
+    for table in metadata.sorted_tables:
+        digest.update(str(CreateTable(table).compile(dialect=engine.dialect)).encode())
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            digest.update(str(CreateIndex(index).compile(dialect=engine.dialect)).encode())
+    return digest.hexdigest()
+
+
+def ensure_schema(metadata: MetaData) -> None:
+    expected = schema_hash(metadata)
+    with engine.connect() as conn:
+        try:
+            current = conn.execute(select(_schema_version.c.schema_hash)).scalar()
+        except DBAPIError:
+            current = None
+    if current == expected:
+        return
+
+    metadata.create_all(bind=engine)
+    _schema_version.create(bind=engine, checkfirst=True)
+    with engine.begin() as conn:
+        conn.execute(delete(_schema_version))
+        conn.execute(insert(_schema_version).values(schema_hash=expected))
+
+
+def run_sqlite_maintenance() -> None:
+    """Refresh planner statistics and checkpoint the WAL back into the main file."""
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA optimize")
+        cursor.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        cursor.close()
+    finally:
+        conn.close()
@@ -1,36 +1,99 @@
+import threading
+import time
+from typing import Optional
+from uuid import UUID
+
+import jwt
+from cachetools import TTLCache
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from jose import JWTError, jwt
+from sqlalchemy import bindparam, lambda_stmt, select
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import Session
 
 from app.config import settings
 from app.database import get_db
 from app.models import Account
 
-bearer_scheme = HTTPBearer()
+# auto_error=False: a missing header is reported as 401 by the dependency
+# below rather than as HTTPBearer's 403.
+bearer_scheme = HTTPBearer(auto_error=False)
 
+# Verified tokens are immutable, so remember (account_id, exp) per raw token
+# for a short while instead of re-running the HMAC + decode on every call.
+# TTLCache expires and evicts entries itself, so no sweeper task is needed.
+_JWT_CACHE: TTLCache = TTLCache(
+    maxsize=settings.JWT_CACHE_MAX_ENTRIES, ttl=settings.JWT_CACHE_TTL_SECONDS
+)
+_JWT_CACHE_LOCK = threading.Lock()
 
-def get_current_account(
-    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+# Built once: the secret never changes at runtime, so neither does the key
+# material or the decode options handed to PyJWT on every request.
+_JWT_KEY = settings.JWT_SECRET.encode("utf-8")
+_JWT_ALGORITHMS = [settings.JWT_ALGORITHM]
+_DECODE_OPTIONS = {"require": ["exp", "sub"], "verify_aud": False}
+
+# Hot auth path: only the columns needed to accept the token, no ORM hydration.
+# lambda_stmt keys the compiled SQL on the lambda's code object, so the
+# statement is neither rebuilt nor re-compiled per request.
+_AUTH_STMT = lambda_stmt(
+    lambda: select(Account.id, Account.is_active).where(Account.id == bindparam("aid"))
+)
+
+
+def _decode_account_id(token: str) -> UUID:
+    with _JWT_CACHE_LOCK:
+        cached = _JWT_CACHE.get(token)
+    if cached is not None:
+        account_id, exp = cached
+        if exp > time.time():
+            return account_id
+        raise ValueError("Token expired")
+
+    payload = jwt.decode(token, _JWT_KEY, algorithms=_JWT_ALGORITHMS, options=_DECODE_OPTIONS)
+    account_id, exp = UUID(payload["sub"]), payload["exp"]
+
+    with _JWT_CACHE_LOCK:
+        _JWT_CACHE[token] = (account_id, exp)
+    return account_id
+
+
+def get_authenticated_account(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
     db: Session = Depends(get_db),
-) -> Account:
+) -> Row:
+    if credentials is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail={"code": "NOT_AUTHENTICATED", "message": "Missing bearer token"},
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     token = credentials.credentials
     try:
-        payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
-        account_id: str = payload.get("sub")
-        if account_id is None:
-            raise ValueError("Missing sub")
-    except (JWTError, ValueError):
+        account_id = _decode_account_id(token)
+    except (jwt.PyJWTError, ValueError):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail={"code": "INVALID_TOKEN", "message": "Token is invalid or expired"},
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    account = db.query(Account).filter(Account.id == account_id).first()
-    if not account or not account.is_active:
+    row = db.execute(_AUTH_STMT, {"aid": account_id}).first()
+    # Dependencies run on their own worker thread; end the read here so the
+    # connection is not held while the endpoint waits to be scheduled.
+    db.commit()
+    if row is None or not row.is_active:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail={"code": "ACCOUNT_NOT_FOUND", "message": "Account not found or inactive"},
         )
+    return row
+
+
+def get_current_account(
+    principal: Row = Depends(get_authenticated_account),
+    db: Session = Depends(get_db),
+) -> Account:
+    account = db.get(Account, principal.id)
+    db.commit()  # as above; the account's attributes reload on first use
     return account
@@ -1,3 +1,6 @@
+import orjson
+
+
 class WalletServiceError(Exception):
     pass
 
@@ -39,14 +42,24 @@ class IdempotencyConflictError(WalletServiceError):
 
 
 class DuplicateIdempotentRequestError(WalletServiceError):
-    def __init__(self, key: str, cached_response: dict):
+    def __init__(self, key: str, cached_body: str):
         self.key = key
-        self.cached_response = cached_response
+        self.cached_body = cached_body
         super().__init__(f"Duplicate idempotent request for key '{key}'.")
 
+    @property
+    def cached_response(self) -> dict:
+        return orjson.loads(self.cached_body)
+
 
 class NegativeBalanceError(WalletServiceError):
     def __init__(self, wallet_id: str, resulting_balance: float):
         super().__init__(
             f"Transaction rejected: wallet {wallet_id} would have a negative balance of {resulting_balance}."
         )
+
+
+class InvalidCursorError(WalletServiceError):
+    def __init__(self, cursor: str):
+        self.cursor = cursor
+        super().__init__(f"Invalid pagination cursor: '{cursor}'.")
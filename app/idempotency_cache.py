@@ -0,0 +1,112 @@
+"""
+Cache layers in front of the idempotency_keys table.
+
+Completed idempotent responses are recorded after their database transaction
+commits, in a per-process LRU and, when configured, in Redis, so a retry can
+be answered without touching the database. Lookups try the LRU, then Redis,
+then fall through to SQL. The table stays the source of truth: with REDIS_URL
+unset, the redis package missing, or Redis unreachable, only the local layer
+is used.
+"""
+import logging
+import threading
+from datetime import timedelta
+from typing import Optional, Tuple
+
+from cachetools import TTLCache
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.config import settings
+
+try:
+    import redis
+except ImportError:  # optional dependency
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+_PENDING_KEY = "idempotency_cache_pending"
+
+_client = (
+    redis.Redis.from_url(settings.REDIS_URL, socket_timeout=0.25)
+    if redis is not None and settings.REDIS_URL
+    else None
+)
+
+
+# Entries are only ever added for committed keys, which never change, so the
+# local copy cannot go stale before the key itself expires.
+_local = TTLCache(
+    maxsize=settings.IDEMPOTENCY_LOCAL_CACHE_MAX_ENTRIES,
+    ttl=settings.IDEMPOTENCY_KEY_TTL_HOURS * 3600,
+)
+_local_lock = threading.Lock()
+
+
+def _remember(key: str, entry: Tuple[str, str]) -> None:
+    with _local_lock:
+        _local[key] = entry
+
+
+def clear() -> None:
+    """Drop every entry from the in-process layer."""
+    with _local_lock:
+        _local.clear()
+
+
+def _redis_key(key: str) -> str:
+    return f"idem:{key}"
+
+
+def lookup(key: str) -> Optional[Tuple[str, str]]:
+    """Return (endpoint, response body JSON) for a completed key, if cached."""
+    with _local_lock:
+        entry = _local.get(key)
+    if entry is not None or _client is None:
+        return entry
+    try:
+        raw = _client.get(_redis_key(key))
+    except redis.RedisError:
+        logger.warning("Idempotency cache lookup failed", exc_info=True)
+        return None
+    if raw is None:
+        return None
+    # Stored as "<endpoint>\n<body>"; anything else is an entry from an older
+    # release and is treated as a miss.
+    endpoint, sep, body = raw.decode().partition("\n")
+    if not sep:
+        return None
+    entry = (endpoint, body)
+    _remember(key, entry)
+    return entry
+
+
+def stage(db: Session, key: str, endpoint: str, body: str) -> None:
+    """Queue a response body for publishing once `db` commits."""
+    db.info.setdefault(_PENDING_KEY, []).append((key, endpoint, body))
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending(session: Session) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    for key, endpoint, body in pending:
+        _remember(key, (endpoint, body))
+    if _client is None:
+        return
+    ttl = timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+    try:
+        with _client.pipeline(transaction=False) as pipe:
+            for key, endpoint, body in pending:
+                value = f"{endpoint}\n{body}"
+                pipe.set(_redis_key(key), value, px=int(ttl.total_seconds() * 1000), nx=True)
+            pipe.execute()
+    except redis.RedisError:
+        logger.warning("Idempotency cache publish failed", exc_info=True)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_pending(session: Session, previous_transaction) -> None:
+    session.info.pop(_PENDING_KEY, None)
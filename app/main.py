@@ -1,19 +1,69 @@
-from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
-from contextlib import asynccontextmanager
+import asyncio
+import logging
+
+import anyio.to_thread
+from fastapi import FastAPI, Request, Response
+from contextlib import asynccontextmanager, suppress
 
 from app.config import settings
 from app.models import Base
-from app.database import engine
-from app.routers.wallet import router as wallet_router
-from app.routers.auth import router as auth_router
+from app.responses import ORJSONResponse
+from app.database import (
+    ensure_schema, get_db_context, relaxed_commit, request_session_scope, run_sqlite_maintenance,
+)
+from app.exceptions import WalletServiceError
+from app.routers.wallet import router as wallet_router, wallet_service_error_handler
+from app.routers.auth import router as auth_router, warm_up_password_hashing
+import app.service as svc
+
+logger = logging.getLogger(__name__)
+
+
+async def _run_periodically(interval_seconds: float, job) -> None:
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await asyncio.to_thread(job)
+        except Exception:
+            logger.exception("Background job %s failed", job.__name__)
+
+
+def _provision_system_wallet_shards() -> None:
+    with get_db_context() as db:
+        svc.ensure_system_wallet_shards(db)
+
+
+def _purge_expired_idempotency_keys() -> None:
+    with get_db_context() as db, relaxed_commit(db):
+        svc.purge_expired_idempotency_keys(db)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    Base.metadata.create_all(bind=engine)
+    # Route handlers are sync and spend most of their time waiting on the
+    # database, so allow more of them in flight than AnyIO's default.
+    anyio.to_thread.current_default_thread_limiter().total_tokens = settings.THREADPOOL_TOKENS
+
+    if settings.RUN_CREATE_ALL:
+        ensure_schema(Base.metadata)
+    await asyncio.to_thread(_provision_system_wallet_shards)
+    await asyncio.to_thread(warm_up_password_hashing)
+
+    tasks = [asyncio.create_task(_run_periodically(
+        settings.IDEMPOTENCY_PURGE_INTERVAL_MINUTES * 60, _purge_expired_idempotency_keys
+    ))]
+    if settings.DATABASE_URL.startswith("sqlite"):
+        tasks.append(asyncio.create_task(_run_periodically(
+            settings.SQLITE_MAINTENANCE_INTERVAL_MINUTES * 60, run_sqlite_maintenance
+        )))
+
     yield
 
+    for task in tasks:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+
 
 app = FastAPI(
     title=settings.APP_NAME,
@@ -21,15 +71,32 @@ app = FastAPI(
     docs_url="/docs",
     redoc_url="/redoc",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 app.include_router(wallet_router)
 app.include_router(auth_router)
+app.add_exception_handler(WalletServiceError, wallet_service_error_handler)
+
+
+@app.middleware("http")
+async def db_session_scope(request: Request, call_next):
+    with request_session_scope():
+        return await call_next(request)
+
+
+# Registered last so it runs outermost: preflight requests never reach the
+# session scope, routing or dependency resolution.
+@app.middleware("http")
+async def options_short_circuit(request: Request, call_next):
+    if request.method == "OPTIONS":
+        return Response(status_code=200)
+    return await call_next(request)
 
 
 @app.exception_handler(Exception)
 async def unhandled_exception_handler(request: Request, exc: Exception):
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={"status": "error", "code": "INTERNAL_ERROR", "message": str(exc)},
     )
@@ -1,11 +1,20 @@
+import enum
 from datetime import datetime, timezone
 from decimal import Decimal
 from sqlalchemy import (
-    Column, String, Numeric, Integer, ForeignKey,
-    DateTime, Text, Boolean, Index, CheckConstraint, UniqueConstraint
+    Column, String, Numeric, Integer, SmallInteger, ForeignKey,
+    DateTime, Text, Boolean, Index, CheckConstraint, UniqueConstraint, case, insert, literal, text
 )
-from sqlalchemy.types import Uuid
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.sql.expression import FunctionElement
+from sqlalchemy.types import BINARY, TypeDecorator
 from sqlalchemy.orm import relationship, declarative_base
+import orjson
+import os
+import threading
+import time
 import uuid
 
 Base = declarative_base()
@@ -15,15 +24,133 @@ def utcnow():
     return datetime.now(timezone.utc)
 
 
+class db_now(FunctionElement):
+    """Database-side current timestamp, used as column server default."""
+    type = DateTime(timezone=True)
+    inherit_cache = True
+
+
+@compiles(db_now)
+def _compile_db_now(element, compiler, **kw):
+    return "CURRENT_TIMESTAMP"
+
+
+@compiles(db_now, "sqlite")
+def _compile_db_now_sqlite(element, compiler, **kw):
+    # CURRENT_TIMESTAMP has only second resolution on SQLite, which would tie
+    # the created_at ordering of transaction history.
+    return "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+
+class db_hours_from_now(FunctionElement):
+    """db_now() shifted forward by a whole number of hours, e.g. for expiries."""
+    type = DateTime(timezone=True)
+    inherit_cache = True
+
+    def __init__(self, hours):
+        super().__init__(literal(int(hours), Integer))
+
+
+@compiles(db_hours_from_now)
+def _compile_db_hours_from_now(element, compiler, **kw):
+    return f"CURRENT_TIMESTAMP + make_interval(hours => {compiler.process(element.clauses, **kw)})"
+
+
+@compiles(db_hours_from_now, "sqlite")
+def _compile_db_hours_from_now_sqlite(element, compiler, **kw):
+    hours = compiler.process(element.clauses, **kw)
+    return f"strftime('%Y-%m-%d %H:%M:%f', 'now', {hours} || ' hours')"
+
+
+# Random bits for uuid7 are drawn from a per-thread buffer refilled by one
+# os.urandom() call, rather than one getrandom syscall per id.
+_RAND_CHUNK = 10
+_RAND_BUFFER_SIZE = _RAND_CHUNK * 256
+_rand_pool = threading.local()
+
+
+def _reset_rand_pool() -> None:
+    # A forked worker must not replay bytes its parent has already handed out.
+    global _rand_pool
+    _rand_pool = threading.local()
+
+
+os.register_at_fork(after_in_child=_reset_rand_pool)
+
+
+def _random_bits() -> int:
+    pool = _rand_pool.__dict__
+    offset = pool.get("offset", _RAND_BUFFER_SIZE)
+    if offset >= _RAND_BUFFER_SIZE:
+        pool["buffer"] = os.urandom(_RAND_BUFFER_SIZE)
+        offset = 0
+    pool["offset"] = offset + _RAND_CHUNK
+    return int.from_bytes(pool["buffer"][offset:offset + _RAND_CHUNK], "big")
+
+
+def uuid7() -> uuid.UUID:
+    """Time-ordered UUID (RFC 9562 v7): 48-bit ms timestamp followed by random bits."""
+    ms = time.time_ns() // 1_000_000
+    rand = _random_bits()
+    value = (ms & 0xFFFF_FFFF_FFFF) << 80 | rand & ((1 << 80) - 1)
+    value = value & ~(0xF << 76) | 0x7 << 76        # version
+    value = value & ~(0x3 << 62) | 0x2 << 62        # variant
+    return uuid.UUID(int=value)
+
+
+class UUIDType(TypeDecorator):
+    """UUID stored natively on PostgreSQL and as 16 raw bytes everywhere else."""
+    impl = BINARY(16)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(postgresql.UUID(as_uuid=True))
+        return dialect.type_descriptor(BINARY(16))
+
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name == "postgresql":
+            return value
+        if not isinstance(value, uuid.UUID):
+            value = uuid.UUID(str(value))
+        return value.bytes
+
+    def process_result_value(self, value, dialect):
+        if value is None or dialect.name == "postgresql":
+            return value
+        return uuid.UUID(bytes=value)
+
+
+class JSONType(TypeDecorator):
+    """JSON stored as JSONB on PostgreSQL and as orjson-encoded TEXT everywhere else."""
+    impl = Text
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(postgresql.JSONB())
+        return dialect.type_descriptor(Text())
+
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name == "postgresql":
+            return value
+        return orjson.dumps(value, default=str).decode()
+
+    def process_result_value(self, value, dialect):
+        if value is None or dialect.name == "postgresql":
+            return value
+        return orjson.loads(value)
+
+
 class AssetType(Base):
     __tablename__ = "asset_types"
 
-    id = Column(Uuid(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUIDType(), primary_key=True, default=uuid.uuid4)
     name = Column(String(100), nullable=False, unique=True)
     symbol = Column(String(20), nullable=False, unique=True)
     description = Column(Text, nullable=True)
     is_active = Column(Boolean, nullable=False, default=True)
-    created_at = Column(DateTime(timezone=True), nullable=False, default=utcnow)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=db_now())
 
     wallets = relationship("Wallet", back_populates="asset_type")
 
@@ -34,16 +161,43 @@ class AssetType(Base):
 class Account(Base):
     __tablename__ = "accounts"
 
-    id = Column(Uuid(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    username = Column(String(150), nullable=False, unique=True)
-    email = Column(String(255), nullable=True, unique=True)
+    id = Column(UUIDType(), primary_key=True, default=uuid.uuid4)
+    username = Column(String(150), nullable=False)
+    email = Column(String(255), nullable=True)
     hashed_password = Column(String(255), nullable=True)
     is_system = Column(Boolean, nullable=False, default=False)
     is_active = Column(Boolean, nullable=False, default=True)
-    created_at = Column(DateTime(timezone=True), nullable=False, default=utcnow)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=db_now())
 
     wallets = relationship("Wallet", back_populates="account")
 
+    # Uniqueness lives in these indexes rather than column constraints. On
+    # PostgreSQL the username index also carries the login columns, so the
+    # credential lookup is an index-only scan.
+    __table_args__ = (
+        Index(
+            "ix_account_username", "username", unique=True,
+            postgresql_include=["id", "hashed_password", "is_active"],
+        ),
+        Index(
+            "ix_account_email", "email", unique=True,
+            postgresql_where=text("email IS NOT NULL"),
+            sqlite_where=text("email IS NOT NULL"),
+        ),
+        # Small partial indexes for the two filtered lookups: the active check
+        # by id (index-only on PostgreSQL) and system accounts by username.
+        Index(
+            "ix_account_active_id", "id",
+            postgresql_where=text("is_active"),
+            sqlite_where=text("is_active"),
+        ),
+        Index(
+            "ix_account_system_username", "username", unique=True,
+            postgresql_where=text("is_system"),
+            sqlite_where=text("is_system"),
+        ),
+    )
+
     def __repr__(self):
         return f"<Account {self.username} system={self.is_system}>"
 
@@ -51,71 +205,96 @@ class Account(Base):
 class Wallet(Base):
     __tablename__ = "wallets"
 
-    id = Column(Uuid(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    account_id = Column(Uuid(as_uuid=True), ForeignKey("accounts.id"), nullable=False)
-    asset_type_id = Column(Uuid(as_uuid=True), ForeignKey("asset_types.id"), nullable=False)
+    id = Column(UUIDType(), primary_key=True, default=uuid.uuid4)
+    account_id = Column(UUIDType(), ForeignKey("accounts.id"), nullable=False)
+    asset_type_id = Column(UUIDType(), ForeignKey("asset_types.id"), nullable=False)
     balance = Column(Numeric(precision=20, scale=4), nullable=False, default=Decimal("0"))
+    # Credit-only system wallets are split across several rows to spread lock
+    # contention; every other wallet is the single row with shard_index 0.
+    shard_index = Column(SmallInteger, nullable=False, default=0, server_default=text("0"))
     version = Column(Integer, nullable=False, default=0)
-    updated_at = Column(DateTime(timezone=True), nullable=False, default=utcnow, onupdate=utcnow)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=db_now(), onupdate=db_now())
 
     account = relationship("Account", back_populates="wallets")
     asset_type = relationship("AssetType", back_populates="wallets")
 
     __table_args__ = (
-        UniqueConstraint("account_id", "asset_type_id", name="uq_wallet_account_asset"),
+        UniqueConstraint("account_id", "asset_type_id", "shard_index", name="uq_wallet_account_asset"),
         CheckConstraint("balance >= 0", name="ck_wallet_balance_non_negative"),
-        Index("ix_wallet_account_asset", "account_id", "asset_type_id"),
     )
 
     def __repr__(self):
         return f"<Wallet account={self.account_id} asset={self.asset_type_id} balance={self.balance}>"
 
 
-class TransactionType(str):
-    TOPUP = "TOPUP"
-    BONUS = "BONUS"
-    SPEND = "SPEND"
-    REFUND = "REFUND"
-    ADJUSTMENT = "ADJUSTMENT"
+class TransactionType(enum.IntEnum):
+    # Stored as SMALLINT — never renumber existing members.
+    TOPUP = 1
+    BONUS = 2
+    SPEND = 3
+    REFUND = 4
+    ADJUSTMENT = 5
 
 
 class Transaction(Base):
     __tablename__ = "transactions"
 
-    id = Column(Uuid(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    reference_id = Column(Uuid(as_uuid=True), nullable=False, index=True, default=uuid.uuid4)
-    transaction_type = Column(String(20), nullable=False)
-    wallet_id = Column(Uuid(as_uuid=True), ForeignKey("wallets.id"), nullable=False)
+    id = Column(UUIDType(), primary_key=True, default=uuid7)
+    reference_id = Column(UUIDType(), nullable=False, index=True, default=uuid7)
+    transaction_type = Column(SmallInteger, nullable=False)
+    wallet_id = Column(UUIDType(), ForeignKey("wallets.id"), nullable=False)
     amount = Column(Numeric(precision=20, scale=4), nullable=False)
     balance_after = Column(Numeric(precision=20, scale=4), nullable=False)
     description = Column(Text, nullable=True)
     idempotency_key = Column(String(255), nullable=True, index=True)
-    metadata_ = Column("metadata", Text, nullable=True)
-    created_at = Column(DateTime(timezone=True), nullable=False, default=utcnow)
+    metadata_ = Column("metadata", JSONType(), nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=db_now())
 
     wallet = relationship("Wallet")
 
     __table_args__ = (
-        Index("ix_transaction_wallet_created", "wallet_id", "created_at"),
+        # Serves keyset pagination ORDER BY created_at DESC, id DESC per wallet.
+        Index("ix_transaction_wallet_created_id", "wallet_id", created_at.desc(), id.desc()),
         Index("ix_transaction_type", "transaction_type"),
     )
 
+    @hybrid_property
+    def transaction_type_name(self) -> str:
+        return TransactionType(self.transaction_type).name
+
+    @transaction_type_name.inplace.expression
+    @classmethod
+    def _transaction_type_name_expression(cls):
+        return case({t.value: t.name for t in TransactionType}, value=cls.transaction_type)
+
+    @classmethod
+    def insert_many(cls, db, rows: list) -> None:
+        """Insert ledger rows as one executemany, bypassing the unit of work."""
+        if rows:
+            db.execute(insert(cls), rows)
+
     def __repr__(self):
-        return f"<Transaction {self.transaction_type} amount={self.amount} ref={self.reference_id}>"
+        return f"<Transaction {self.transaction_type_name} amount={self.amount} ref={self.reference_id}>"
 
 
 class IdempotencyKey(Base):
     __tablename__ = "idempotency_keys"
 
-    id = Column(Uuid(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUIDType(), primary_key=True, default=uuid7)
     key = Column(String(255), nullable=False, unique=True)
     endpoint = Column(String(100), nullable=False)
+    # The replayed HTTP body, stored pre-encoded so a duplicate request is
+    # answered without decoding and re-encoding it.
     response_body = Column(Text, nullable=False)
-    created_at = Column(DateTime(timezone=True), nullable=False, default=utcnow)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=db_now())
     expires_at = Column(DateTime(timezone=True), nullable=True)
 
+    # `key` is already covered by its unique index; this composite lets the
+    # lookup read expires_at from the index. PostgreSQL rejects now() in a
+    # partial-index predicate, so expired rows are purged instead (see
+    # service.purge_expired_idempotency_keys).
     __table_args__ = (
-        Index("ix_idempotency_key", "key"),
+        Index("ix_idem_key_exp", "key", "expires_at"),
     )
 
     def __repr__(self):
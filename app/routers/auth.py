@@ -1,98 +1,206 @@
+import base64
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 from typing import Optional
-from uuid import UUID
+from uuid import UUID, uuid4
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from jose import jwt
 import bcrypt
-from sqlalchemy import select
+import jwt
+import orjson
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import bindparam, insert, or_, select, update
 from sqlalchemy.orm import Session
 
 from app.config import settings
 from app.database import get_db
 from app.models import Account, AssetType, Wallet
+from app.routers.wallet import invalidate_catalog_cache
 from app.schemas import LoginRequest, RegisterRequest, TokenResponse
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
 
+# Only the columns login needs, all carried by ix_account_username's INCLUDE
+# list on PostgreSQL, so the lookup is an index-only scan.
+_LOGIN_STMT = select(Account.id, Account.hashed_password).where(
+    Account.username == bindparam("u")
+)
+
+_ACTIVE_ASSET_TYPE_IDS_STMT = select(AssetType.id).where(AssetType.is_active == True)
+
+
+# Argon2id with the OWASP minimum profile (19 MiB, t=2, p=1).
+_password_hasher = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
+
+# argon2 and bcrypt release the GIL while hashing, so threads run them in
+# parallel; the pool caps concurrent hashes at one per core so a burst of
+# logins cannot oversubscribe the CPU (or memory, at 19 MiB per hash).
+_HASH_WORKERS = os.cpu_count() or 1
+_HASH_POOL = ThreadPoolExecutor(max_workers=_HASH_WORKERS, thread_name_prefix="pwhash")
+
+
+# Verified against when the username is unknown; see login().
+_DUMMY_HASH = _password_hasher.hash("dummy-password-for-timing-equalisation")
+
+
+def _is_bcrypt_hash(hashed: str) -> bool:
+    return hashed.startswith(("$2a$", "$2b$", "$2y$"))
+
 
 def _hash_password(plain: str) -> str:
-    return bcrypt.hashpw(plain.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    return _HASH_POOL.submit(_password_hasher.hash, plain).result()
 
 
 def _verify_password(plain: str, hashed: str) -> bool:
-    return bcrypt.checkpw(plain.encode("utf-8"), hashed.encode("utf-8"))
+    return _HASH_POOL.submit(_check_password, plain, hashed).result()
+
+
+def _check_password(plain: str, hashed: str) -> bool:
+    # Accounts registered before the switch to Argon2id still hold bcrypt
+    # hashes; they are upgraded on their next successful login.
+    if _is_bcrypt_hash(hashed):
+        return bcrypt.checkpw(plain.encode("utf-8"), hashed.encode("utf-8"))
+    try:
+        return _password_hasher.verify(hashed, plain)
+    except (VerificationError, InvalidHashError):
+        return False
+
+
+def _needs_rehash(hashed: str) -> bool:
+    return _is_bcrypt_hash(hashed) or _password_hasher.check_needs_rehash(hashed)
+
+
+def warm_up_password_hashing() -> None:
+    """Start every hash worker and exercise both backends before the first login."""
+    legacy = bcrypt.hashpw(b"warmup", bcrypt.gensalt(rounds=4)).decode("utf-8")
+    jobs = [_HASH_POOL.submit(_check_password, "warmup", _DUMMY_HASH) for _ in range(_HASH_WORKERS)]
+    jobs.append(_HASH_POOL.submit(_check_password, "warmup", legacy))
+    for job in jobs:
+        job.result()
+
+
+def _b64url(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+# For HS256 the header segment never changes, so tokens are assembled by hand:
+# one orjson dump and one OpenSSL HMAC per token. Other algorithms use PyJWT.
+_JWT_KEY = settings.JWT_SECRET.encode("utf-8")
+_HS256_HEADER = _b64url(orjson.dumps({"alg": "HS256", "typ": "JWT"}))
 
 
 def _create_access_token(data: dict, expires_minutes: Optional[int] = None) -> str:
     expire = datetime.now(timezone.utc) + timedelta(
         minutes=expires_minutes or settings.ACCESS_TOKEN_EXPIRE_MINUTES
     )
-    payload = {**data, "exp": expire}
-    return jwt.encode(payload, settings.JWT_SECRET, algorithm=settings.JWT_ALGORITHM)
+    payload = {**data, "exp": int(expire.timestamp())}
+    if settings.JWT_ALGORITHM != "HS256":
+        return jwt.encode(payload, _JWT_KEY, algorithm=settings.JWT_ALGORITHM)
+
+    signing_input = f"{_HS256_HEADER}.{_b64url(orjson.dumps(payload))}"
+    signature = hmac.new(_JWT_KEY, signing_input.encode("ascii"), hashlib.sha256).digest()
+    return f"{signing_input}.{_b64url(signature)}"
 
 
 @router.post("/register", response_model=TokenResponse, status_code=status.HTTP_201_CREATED)
 def register(body: RegisterRequest, db: Session = Depends(get_db)):
-    if db.query(Account).filter(Account.username == body.username).first():
+    # Hashed before the first query, so the connection is not held (and, on
+    # SQLite, other writers are not kept waiting) for the duration of argon2.
+    hashed_password = _hash_password(body.password)
+
+    # One round trip for both uniqueness checks; a username clash wins over
+    # an email clash, as it did when they were checked one after the other.
+    clash = Account.username == body.username
+    if body.email:
+        clash = or_(clash, Account.email == body.email)
+    taken = db.execute(select(Account.username).where(clash)).scalars().all()
+    if body.username in taken:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail={"code": "USERNAME_TAKEN", "message": "Username already exists"},
         )
-    if body.email and db.query(Account).filter(Account.email == body.email).first():
+    if taken:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail={"code": "EMAIL_TAKEN", "message": "Email already registered"},
         )
 
-    account = Account(
+    # The id is assigned here so the account and its wallets go out in one
+    # transaction without an intermediate flush, and nothing is read back.
+    account_id = uuid4()
+    db.execute(insert(Account).values(
+        id=account_id,
         username=body.username,
         email=body.email,
-        hashed_password=_hash_password(body.password),
+        hashed_password=hashed_password,
         is_system=False,
         is_active=True,
-    )
-    db.add(account)
-    db.flush()
+    ))
 
-    # auto-create a wallet for every active asset type
-    asset_types = db.execute(select(AssetType).where(AssetType.is_active == True)).scalars().all()
-    for asset in asset_types:
-        db.add(Wallet(account_id=account.id, asset_type_id=asset.id, balance=Decimal("0")))
+    # auto-create a wallet for every active asset type, as one executemany
+    asset_type_ids = db.execute(_ACTIVE_ASSET_TYPE_IDS_STMT).scalars().all()
+    if asset_type_ids:
+        db.execute(insert(Wallet), [
+            {"account_id": account_id, "asset_type_id": asset_type_id, "balance": Decimal("0")}
+            for asset_type_id in asset_type_ids
+        ])
 
     db.commit()
-    db.refresh(account)
+    invalidate_catalog_cache()
 
-    token = _create_access_token({"sub": str(account.id), "username": account.username})
-    return TokenResponse(access_token=token, account_id=account.id, username=account.username)
+    token = _create_access_token({"sub": str(account_id), "username": body.username})
+    return TokenResponse.model_construct(
+        access_token=token, account_id=account_id, username=body.username
+    )
 
 
 @router.post("/login", response_model=TokenResponse)
 def login(body: LoginRequest, db: Session = Depends(get_db)):
-    account = db.query(Account).filter(Account.username == body.username).first()
+    # Invariant: every attempt costs exactly one password verification, and
+    # secrets are never compared with `==` (use hmac.compare_digest). Unknown
+    # usernames are checked against a dummy hash so response timing does not
+    # reveal which accounts exist.
+    account = db.execute(_LOGIN_STMT, {"u": body.username}).first()
+    # End the read-only transaction before hashing so the connection goes
+    # back to the pool (on SQLite, the single writer connection).
+    db.commit()
+    has_password = account is not None and account.hashed_password is not None
+    password_ok = _verify_password(
+        body.password, account.hashed_password if has_password else _DUMMY_HASH
+    )
 
-    if not account or not account.hashed_password:
+    if not has_password or not password_ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail={"code": "INVALID_CREDENTIALS", "message": "Invalid username or password"},
         )
-    if not _verify_password(body.password, account.hashed_password):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail={"code": "INVALID_CREDENTIALS", "message": "Invalid username or password"},
+    if _needs_rehash(account.hashed_password):
+        db.execute(
+            update(Account)
+            .where(Account.id == account.id)
+            .values(hashed_password=_hash_password(body.password))
         )
-    token = _create_access_token({"sub": str(account.id), "username": account.username})
-    return TokenResponse(access_token=token, account_id=account.id, username=account.username)
+        db.commit()
+
+    token = _create_access_token({"sub": str(account.id), "username": body.username})
+    return TokenResponse.model_construct(
+        access_token=token, account_id=account.id, username=body.username
+    )
 
 
 @router.delete("/accounts/{account_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_account(account_id: UUID, db: Session = Depends(get_db)):
-    account = db.query(Account).filter(Account.id == account_id, Account.is_system == False).first()
-    if not account:
+    account = db.get(Account, account_id)
+    if account is None or account.is_system:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail={"code": "ACCOUNT_NOT_FOUND", "message": "Account not found"},
         )
     db.delete(account)
     db.commit()
+    invalidate_catalog_cache()
@@ -1,51 +1,122 @@
+import threading
 from decimal import Decimal
-from typing import List, Optional
+from typing import Callable, List, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from cachetools import TTLCache
+from fastapi import APIRouter, Depends, Header, Query, Request, Response, status
 from sqlalchemy.orm import Session
 
-from app.database import get_db
+from app.config import settings
+from app.database import get_db, get_db_read
 from app.exceptions import (
     AccountNotFoundError,
     AssetTypeNotFoundError,
     DuplicateIdempotentRequestError,
     IdempotencyConflictError,
     InsufficientFundsError,
+    InvalidCursorError,
     NegativeBalanceError,
     WalletNotFoundError,
+    WalletServiceError,
 )
 from app.schemas import (
+    AccountListAdapter,
+    AssetTypeListAdapter,
     BalanceResponse,
     BonusRequest,
+    BulkBonusRequest,
+    BulkBonusResponse,
     SpendRequest,
     TopUpRequest,
+    TransactionListAdapter,
     TransactionListResponse,
-    TransactionOut,
     TransactionResponse,
     AssetTypeOut,
     AccountOut,
+    to_minor,
 )
+from app.responses import ORJSONResponse
 import app.service as svc
 
-router = APIRouter(prefix="/wallet", tags=["Wallet"])
+router = APIRouter(prefix="/wallet", tags=["Wallet"], default_response_class=ORJSONResponse)
 
 
-def _handle_service_errors(exc: Exception) -> HTTPException:
-    mapping = {
-        InsufficientFundsError: (status.HTTP_402_PAYMENT_REQUIRED, "INSUFFICIENT_FUNDS"),
-        WalletNotFoundError:    (status.HTTP_404_NOT_FOUND,         "WALLET_NOT_FOUND"),
-        AccountNotFoundError:   (status.HTTP_404_NOT_FOUND,         "ACCOUNT_NOT_FOUND"),
-        AssetTypeNotFoundError: (status.HTTP_404_NOT_FOUND,         "ASSET_TYPE_NOT_FOUND"),
-        IdempotencyConflictError: (status.HTTP_409_CONFLICT,        "IDEMPOTENCY_CONFLICT"),
-        NegativeBalanceError:   (status.HTTP_500_INTERNAL_SERVER_ERROR, "NEGATIVE_BALANCE"),
-    }
-    for exc_cls, (http_code, code) in mapping.items():
+_ERROR_MAP = {
+    InsufficientFundsError:   (status.HTTP_402_PAYMENT_REQUIRED,       "INSUFFICIENT_FUNDS"),
+    WalletNotFoundError:      (status.HTTP_404_NOT_FOUND,              "WALLET_NOT_FOUND"),
+    AccountNotFoundError:     (status.HTTP_404_NOT_FOUND,              "ACCOUNT_NOT_FOUND"),
+    AssetTypeNotFoundError:   (status.HTTP_404_NOT_FOUND,              "ASSET_TYPE_NOT_FOUND"),
+    InvalidCursorError:       (status.HTTP_400_BAD_REQUEST,            "INVALID_CURSOR"),
+    IdempotencyConflictError: (status.HTTP_409_CONFLICT,               "IDEMPOTENCY_CONFLICT"),
+    NegativeBalanceError:     (status.HTTP_500_INTERNAL_SERVER_ERROR,  "NEGATIVE_BALANCE"),
+}
+
+
+def _error_status(exc: Exception) -> tuple:
+    hit = _ERROR_MAP.get(type(exc))
+    if hit is not None:
+        return hit
+    for exc_cls, mapped in _ERROR_MAP.items():
         if isinstance(exc, exc_cls):
-            return HTTPException(status_code=http_code, detail={"code": code, "message": str(exc)})
-    return HTTPException(status_code=500, detail={"code": "INTERNAL_ERROR", "message": str(exc)})
+            return mapped
+    return status.HTTP_500_INTERNAL_SERVER_ERROR, "INTERNAL_ERROR"
+
+
+async def wallet_service_error_handler(request: Request, exc: WalletServiceError) -> ORJSONResponse:
+    """Registered on the app for WalletServiceError; same body shape as HTTPException."""
+    http_code, code = _error_status(exc)
+    return ORJSONResponse(
+        status_code=http_code,
+        content={"detail": {"code": code, "message": str(exc)}},
+    )
+
+
+# Serialized bodies of the small, rarely-changing list endpoints. Misses are
+# rebuilt under the lock so concurrent pollers trigger a single query.
+_CATALOG_CACHE: TTLCache = TTLCache(maxsize=16, ttl=settings.CATALOG_CACHE_TTL_SECONDS)
+_CATALOG_CACHE_LOCK = threading.Lock()
+
+
+def _cached_catalog(key: tuple, build: Callable[[], bytes]) -> bytes:
+    with _CATALOG_CACHE_LOCK:
+        body = _CATALOG_CACHE.get(key)
+        if body is None:
+            body = _CATALOG_CACHE[key] = build()
+    return body
+
+
+def invalidate_catalog_cache() -> None:
+    """Drop cached list responses; call after accounts or asset types change."""
+    with _CATALOG_CACHE_LOCK:
+        _CATALOG_CACHE.clear()
+    svc.invalidate_asset_type_cache()
 
 
+def _transaction_response(result: dict) -> ORJSONResponse:
+    # Service results are already shaped like TransactionResponse's JSON body,
+    # so they are encoded directly instead of through the response model.
+    return ORJSONResponse(result, status_code=status.HTTP_201_CREATED)
+
+
+def _replay_response(exc: DuplicateIdempotentRequestError) -> Response:
+    """The stored body of a completed idempotent request, sent back verbatim."""
+    body = exc.cached_body
+    if '"amount_minor"' not in body:
+        # Stored by a release that kept the bare service result.
+        result = exc.cached_response
+        amount, balance_after = Decimal(result["amount"]), Decimal(result["balance_after"])
+        body = TransactionResponse.model_construct(
+            reference_id=UUID(result["reference_id"]),
+            transaction_type=result["transaction_type"],
+            amount=amount,
+            amount_minor=to_minor(amount),
+            balance_after=balance_after,
+            balance_after_minor=to_minor(balance_after),
+            message=result["message"],
+        ).model_dump_json()
+    return Response(body, status_code=status.HTTP_200_OK, media_type="application/json")
+
 
 @router.get(
     "/balance/{account_id}/{asset_type_id}",
@@ -55,19 +126,17 @@ def _handle_service_errors(exc: Exception) -> HTTPException:
 def get_balance(
     account_id: UUID,
     asset_type_id: UUID,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db_read),
 ):
-    try:
-        wallet, account, asset = svc.get_balance(db, account_id, asset_type_id)
-    except Exception as e:
-        raise _handle_service_errors(e)
+    balance, account, asset = svc.get_balance(db, account_id, asset_type_id)
 
     return BalanceResponse(
         account_id=account.id,
         username=account.username,
         asset_type=asset.name,
         symbol=asset.symbol,
-        balance=wallet.balance,
+        balance=balance,
+        balance_minor=to_minor(balance),
     )
 
 
@@ -80,20 +149,19 @@ def get_transactions(
     account_id: UUID,
     asset_type_id: UUID,
     limit: int = Query(default=20, ge=1, le=100),
-    offset: int = Query(default=0, ge=0),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(default=None, description="next_cursor from the previous page"),
+    db: Session = Depends(get_db_read),
 ):
-    try:
-        txs, total = svc.get_transaction_history(db, account_id, asset_type_id, limit, offset)
-        _, _, asset = svc.get_balance(db, account_id, asset_type_id)
-    except Exception as e:
-        raise _handle_service_errors(e)
+    txs, total, next_cursor, asset_name, _ = svc.get_transaction_history_with_asset(
+        db, account_id, asset_type_id, limit, cursor
+    )
 
     return TransactionListResponse(
         account_id=account_id,
-        asset_type=asset.name,
-        transactions=[TransactionOut.model_validate(t) for t in txs],
+        asset_type=asset_name,
+        transactions=TransactionListAdapter.validate_python(txs, from_attributes=True),
         total=total,
+        next_cursor=next_cursor,
     )
 
 
@@ -102,8 +170,12 @@ def get_transactions(
     response_model=List[AssetTypeOut],
     summary="List all asset types",
 )
-def list_asset_types(db: Session = Depends(get_db)):
-    return svc.list_asset_types(db)
+def list_asset_types(db: Session = Depends(get_db_read)):
+    def build() -> bytes:
+        rows = AssetTypeListAdapter.validate_python(svc.list_asset_types(db), from_attributes=True)
+        return AssetTypeListAdapter.dump_json(rows)
+
+    return Response(_cached_catalog(("asset_types",), build), media_type="application/json")
 
 
 @router.get(
@@ -113,9 +185,16 @@ def list_asset_types(db: Session = Depends(get_db)):
 )
 def list_accounts(
     include_system: bool = Query(default=False, description="Include system accounts"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db_read),
 ):
-    return svc.list_accounts(db, include_system=include_system)
+    def build() -> bytes:
+        rows = AccountListAdapter.validate_python(
+            svc.list_accounts(db, include_system=include_system), from_attributes=True
+        )
+        return AccountListAdapter.dump_json(rows)
+
+    key = ("accounts", include_system)
+    return Response(_cached_catalog(key, build), media_type="application/json")
 
 
 @router.post(
@@ -139,14 +218,11 @@ def top_up(
             description=request.description,
             idempotency_key=idempotency_key,
         )
-        db.commit()
     except DuplicateIdempotentRequestError as e:
-        return TransactionResponse(**e.cached_response)
-    except Exception as e:
-        db.rollback()
-        raise _handle_service_errors(e)
+        return _replay_response(e)
+    db.commit()
 
-    return TransactionResponse(**result)
+    return _transaction_response(result)
 
 
 @router.post(
@@ -170,14 +246,38 @@ def issue_bonus(
             description=request.description,
             idempotency_key=idempotency_key,
         )
-        db.commit()
     except DuplicateIdempotentRequestError as e:
-        return TransactionResponse(**e.cached_response)
-    except Exception as e:
-        db.rollback()
-        raise _handle_service_errors(e)
+        return _replay_response(e)
+    db.commit()
+
+    return _transaction_response(result)
+
+
+@router.post(
+    "/bonus/bulk",
+    response_model=BulkBonusResponse,
+    status_code=status.HTTP_201_CREATED,
+    summary="Issue bonuses to many users at once",
+)
+def issue_bonus_bulk(
+    request: BulkBonusRequest,
+    idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key"),
+    db: Session = Depends(get_db),
+):
+    try:
+        result = svc.issue_bonus_bulk(
+            db=db,
+            recipients=[(r.user_account_id, r.amount) for r in request.recipients],
+            asset_type_id=request.asset_type_id,
+            reason=request.reason,
+            description=request.description,
+            idempotency_key=idempotency_key,
+        )
+    except DuplicateIdempotentRequestError as e:
+        return _replay_response(e)
+    db.commit()
 
-    return TransactionResponse(**result)
+    return _transaction_response(result)
 
 
 @router.post(
@@ -201,11 +301,8 @@ def spend(
             description=request.description,
             idempotency_key=idempotency_key,
         )
-        db.commit()
     except DuplicateIdempotentRequestError as e:
-        return TransactionResponse(**e.cached_response)
-    except Exception as e:
-        db.rollback()
-        raise _handle_service_errors(e)
+        return _replay_response(e)
+    db.commit()
 
-    return TransactionResponse(**result)
+    return _transaction_response(result)
@@ -5,8 +5,45 @@ from datetime import datetime
 from decimal import Decimal
 from typing import List, Optional
 from uuid import UUID
-from pydantic import BaseModel, Field, field_validator
+from pydantic import AliasChoices, BaseModel, Field, TypeAdapter, model_validator
 
+# Every amount is stored with 4 decimal places (NUMERIC(20, 4)), so one
+# minor unit is 0.0001 of any asset.
+MINOR_UNITS = 10_000
+
+
+def to_minor(value: Decimal) -> int:
+    return int(value * MINOR_UNITS)
+
+
+def from_minor(value: int) -> Decimal:
+    return Decimal(value).scaleb(-4)
+
+
+class AmountRequest(BaseModel):
+    """
+    Base for mutating requests: the amount may be sent either as a decimal
+    `amount` or as integer `amount_minor` (units of 0.0001).
+    """
+    # Unknown fields are rejected inside pydantic-core. strict=True is not used:
+    # FastAPI validates bodies in python mode, where strict UUID/Decimal fields
+    # would refuse the JSON strings clients send.
+    model_config = {"extra": "forbid", "str_strip_whitespace": True}
+
+    # le= is the NUMERIC(20,4) ceiling in minor units, the bound `amount`'s
+    # max_digits/decimal_places enforce; the converted value is not re-validated.
+    amount_minor: Optional[int] = Field(
+        None, gt=0, le=10**20 - 1,
+        description="Amount in minor units of 0.0001; alternative to `amount`",
+    )
+
+    @model_validator(mode="after")
+    def resolve_amount(self):
+        if (self.amount is None) == (self.amount_minor is None):
+            raise ValueError("Provide exactly one of amount or amount_minor")
+        if self.amount is None:
+            self.amount = from_minor(self.amount_minor)
+        return self
 
 
 class AssetTypeOut(BaseModel):
@@ -46,9 +83,10 @@ class BalanceResponse(BaseModel):
     asset_type: str
     symbol: str
     balance: Decimal
+    balance_minor: int
 
 
-class TopUpRequest(BaseModel):
+class TopUpRequest(AmountRequest):
     """
     Credits the user's wallet.
     Represents a user purchasing virtual credits with real money.
@@ -56,65 +94,72 @@ class TopUpRequest(BaseModel):
     """
     user_account_id: UUID = Field(..., description="The user receiving the credits")
     asset_type_id: UUID = Field(..., description="Which virtual currency to credit")
-    amount: Decimal = Field(..., gt=0, description="Amount to credit (must be > 0)")
+    amount: Optional[Decimal] = Field(
+        None, gt=0, max_digits=20, decimal_places=4, description="Amount to credit (must be > 0)"
+    )
     payment_reference: Optional[str] = Field(
         None,
         description="External payment gateway reference (stored in metadata)"
     )
     description: Optional[str] = Field(None, description="Human-readable note")
 
-    @field_validator("amount")
-    @classmethod
-    def amount_positive(cls, v: Decimal) -> Decimal:
-        if v <= 0:
-            raise ValueError("Amount must be positive")
-        return v
 
-
-class BonusRequest(BaseModel):
+class BonusRequest(AmountRequest):
     """
     System-issued free credits (referral bonus, login reward, etc.).
     """
     user_account_id: UUID = Field(..., description="The user receiving the bonus")
     asset_type_id: UUID = Field(..., description="Which virtual currency to credit")
-    amount: Decimal = Field(..., gt=0, description="Bonus amount (must be > 0)")
+    amount: Optional[Decimal] = Field(
+        None, gt=0, max_digits=20, decimal_places=4, description="Bonus amount (must be > 0)"
+    )
     reason: Optional[str] = Field(None, description="Reason for the bonus")
     description: Optional[str] = Field(None, description="Human-readable note")
 
-    @field_validator("amount")
-    @classmethod
-    def amount_positive(cls, v: Decimal) -> Decimal:
-        if v <= 0:
-            raise ValueError("Amount must be positive")
-        return v
+
+class BulkBonusRecipient(AmountRequest):
+    user_account_id: UUID = Field(..., description="The user receiving the bonus")
+    amount: Optional[Decimal] = Field(
+        None, gt=0, max_digits=20, decimal_places=4, description="Bonus amount (must be > 0)"
+    )
 
 
-class SpendRequest(BaseModel):
+class BulkBonusRequest(BaseModel):
+    """
+    Bonuses for many users in one transaction, e.g. a campaign grant.
+    All recipients are credited, or none are.
+    """
+    model_config = {"extra": "forbid", "str_strip_whitespace": True}
+
+    asset_type_id: UUID = Field(..., description="Which virtual currency to credit")
+    recipients: List[BulkBonusRecipient] = Field(..., min_length=1, max_length=1000)
+    reason: Optional[str] = Field(None, description="Reason for the bonus")
+    description: Optional[str] = Field(None, description="Human-readable note")
+
+
+class SpendRequest(AmountRequest):
     """
     Deducts credits from the user's wallet for an in-app purchase.
     """
     user_account_id: UUID = Field(..., description="The user spending the credits")
     asset_type_id: UUID = Field(..., description="Which virtual currency to deduct")
-    amount: Decimal = Field(..., gt=0, description="Amount to deduct (must be > 0)")
+    amount: Optional[Decimal] = Field(
+        None, gt=0, max_digits=20, decimal_places=4, description="Amount to deduct (must be > 0)"
+    )
     item_reference: Optional[str] = Field(
         None,
         description="Internal reference for the item/service being purchased"
     )
     description: Optional[str] = Field(None, description="Human-readable note")
 
-    @field_validator("amount")
-    @classmethod
-    def amount_positive(cls, v: Decimal) -> Decimal:
-        if v <= 0:
-            raise ValueError("Amount must be positive")
-        return v
-
 
 
 class TransactionOut(BaseModel):
     id: UUID
     reference_id: UUID
-    transaction_type: str
+    transaction_type: str = Field(
+        validation_alias=AliasChoices("transaction_type_name", "transaction_type")
+    )
     wallet_id: UUID
     amount: Decimal
     balance_after: Decimal
@@ -131,7 +176,27 @@ class TransactionResponse(BaseModel):
     reference_id: UUID
     transaction_type: str
     amount: Decimal
+    amount_minor: int
+    balance_after: Decimal
+    balance_after_minor: int
+    message: str
+
+
+class BulkBonusRecipientResult(BaseModel):
+    user_account_id: UUID
+    amount: Decimal
+    amount_minor: int
     balance_after: Decimal
+    balance_after_minor: int
+
+
+class BulkBonusResponse(BaseModel):
+    status: str = "success"
+    reference_id: UUID
+    transaction_type: str
+    amount: Decimal = Field(..., description="Total issued across all recipients")
+    amount_minor: int
+    recipients: List[BulkBonusRecipientResult]
     message: str
 
 
@@ -140,6 +205,9 @@ class TransactionListResponse(BaseModel):
     asset_type: str
     transactions: List[TransactionOut]
     total: int
+    next_cursor: Optional[str] = Field(
+        None, description="Pass as `cursor` to fetch the next page; null on the last page"
+    )
 
 
 
@@ -166,3 +234,9 @@ class TokenResponse(BaseModel):
     token_type: str = "bearer"
     account_id: UUID
     username: str
+
+
+# Compiled once; validate ORM rows and dump JSON bytes in a single pydantic-core pass.
+AssetTypeListAdapter = TypeAdapter(List[AssetTypeOut])
+AccountListAdapter = TypeAdapter(List[AccountOut])
+TransactionListAdapter = TypeAdapter(List[TransactionOut])
@@ -1,12 +1,19 @@
-import json
-import uuid
-from datetime import datetime, timezone, timedelta
+import base64
+import binascii
+import threading
 from decimal import Decimal
-from typing import Optional, Tuple
+from typing import Dict, Optional, Sequence, Tuple
 from uuid import UUID
 
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+import orjson
+from cachetools import TTLCache
+from sqlalchemy import (
+    Row, Text, and_, bindparam, case, cast, delete, func, insert, select, tuple_, update,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased
 
 from app.exceptions import (
     AccountNotFoundError,
@@ -14,7 +21,7 @@ from app.exceptions import (
     DuplicateIdempotentRequestError,
     IdempotencyConflictError,
     InsufficientFundsError,
-    NegativeBalanceError,
+    InvalidCursorError,
     WalletNotFoundError,
 )
 from app.models import (
@@ -22,148 +29,340 @@ from app.models import (
     AssetType,
     IdempotencyKey,
     Transaction,
+    TransactionType,
     Wallet,
+    db_hours_from_now,
+    db_now,
+    uuid7,
 )
 from app.config import settings
+from app.schemas import to_minor
+from app import idempotency_cache
 
 SYSTEM_TREASURY = "system_treasury"
 SYSTEM_BONUS_POOL = "system_bonus_pool"
 SYSTEM_REVENUE = "system_revenue"
 
-_IS_SQLITE = settings.DATABASE_URL.startswith("sqlite")
+
+# Asset types are near-static seed data. Active ones are remembered as plain
+# (id, name, symbol) rows, which are safe to share across sessions and threads.
+_ASSET_TYPE_CACHE: TTLCache = TTLCache(maxsize=1024, ttl=settings.CATALOG_CACHE_TTL_SECONDS)
+_ASSET_TYPE_CACHE_LOCK = threading.Lock()
+_ASSET_TYPE_STMT = select(AssetType.id, AssetType.name, AssetType.symbol).where(
+    AssetType.id == bindparam("tid"), AssetType.is_active == True
+)
 
 
-def _get_active_asset_type(db: Session, asset_type_id: UUID) -> AssetType:
-    asset = db.get(AssetType, asset_type_id)
-    if not asset or not asset.is_active:
-        raise AssetTypeNotFoundError(str(asset_type_id))
+def _get_active_asset_type(db: Session, asset_type_id: UUID) -> Row:
+    with _ASSET_TYPE_CACHE_LOCK:
+        asset = _ASSET_TYPE_CACHE.get(asset_type_id)
+    if asset is None:
+        asset = db.execute(_ASSET_TYPE_STMT, {"tid": asset_type_id}).first()
+        if asset is None:
+            raise AssetTypeNotFoundError(str(asset_type_id))
+        with _ASSET_TYPE_CACHE_LOCK:
+            _ASSET_TYPE_CACHE[asset_type_id] = asset
     return asset
 
 
-def _get_active_account(db: Session, account_id: UUID) -> Account:
-    account = db.get(Account, account_id)
-    if not account or not account.is_active:
+def invalidate_asset_type_cache() -> None:
+    """Forget cached asset types; call after one is changed or deactivated."""
+    with _ASSET_TYPE_CACHE_LOCK:
+        _ASSET_TYPE_CACHE.clear()
+
+
+_ACTIVE_ACCOUNT_STMT = select(Account.id).where(
+    Account.id == bindparam("aid"), Account.is_active == True
+)
+
+
+def _get_active_account(db: Session, account_id: UUID) -> None:
+    if db.execute(_ACTIVE_ACCOUNT_STMT, {"aid": account_id}).scalar() is None:
         raise AccountNotFoundError(str(account_id))
-    return account
 
 
-def _get_system_account(db: Session, username: str) -> Account:
-    account = db.execute(
-        select(Account).where(Account.username == username, Account.is_system == True)
-    ).scalar_one_or_none()
-    if not account:
+def _get_system_account_id_uncached(db: Session, username: str) -> UUID:
+    account_id = db.execute(
+        select(Account.id).where(Account.username == username, Account.is_system == True)
+    ).scalar()
+    if account_id is None:
         raise AccountNotFoundError(f"system:{username}")
-    return account
+    return account_id
 
 
-def _lock_wallet(db: Session, account_id: UUID, asset_type_id: UUID) -> Wallet:
-    q = select(Wallet).where(
-        Wallet.account_id == account_id,
-        Wallet.asset_type_id == asset_type_id,
-    )
-    if not _IS_SQLITE:
-        q = q.with_for_update()
+# System accounts are seed data and never change at runtime, so their ids are
+# resolved once per process.
+_SYSTEM_ACCOUNT_ID_CACHE: Dict[str, UUID] = {}
+_SYSTEM_ACCOUNT_ID_LOCK = threading.Lock()
 
-    wallet = db.execute(q).scalar_one_or_none()
 
-    if wallet is None:
-        raise WalletNotFoundError(str(account_id), str(asset_type_id))
-    return wallet
+def _get_system_account_id(db: Session, username: str) -> UUID:
+    account_id = _SYSTEM_ACCOUNT_ID_CACHE.get(username)
+    if account_id is None:
+        account_id = _get_system_account_id_uncached(db, username)
+        with _SYSTEM_ACCOUNT_ID_LOCK:
+            _SYSTEM_ACCOUNT_ID_CACHE[username] = account_id
+    return account_id
+
+
+def _revenue_shard(user_account_id: UUID) -> int:
+    return user_account_id.int % settings.SYSTEM_WALLET_SHARDS
+
+
+def ensure_system_wallet_shards(db: Session) -> int:
+    """
+    Create any missing revenue wallet shards next to each existing shard 0.
+
+    Safe to run from several workers at once: a concurrent insert of the same
+    shard loses on the unique constraint and is rolled back. Returns the
+    number of rows created.
+    """
+    revenue_id = db.execute(
+        select(Account.id).where(Account.username == SYSTEM_REVENUE, Account.is_system == True)
+    ).scalar()
+    if revenue_id is None:
+        return 0
+    existing = set(db.execute(
+        select(Wallet.asset_type_id, Wallet.shard_index).where(Wallet.account_id == revenue_id)
+    ).tuples())
+    rows = [
+        {"account_id": revenue_id, "asset_type_id": asset_type_id,
+         "shard_index": shard, "balance": Decimal("0")}
+        for asset_type_id in {a for a, shard in existing if shard == 0}
+        for shard in range(1, settings.SYSTEM_WALLET_SHARDS)
+        if (asset_type_id, shard) not in existing
+    ]
+    if not rows:
+        return 0
+    try:
+        db.execute(insert(Wallet), rows)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return 0
+    return len(rows)
+
+
+_UPSERT_INSERTS = {"postgresql": pg_insert, "sqlite": sqlite_insert}
+
+
+def _ensure_wallet(db: Session, account_id: UUID, asset_type_id: UUID) -> Row:
+    """
+    Return (id, balance, version) of the wallet, creating it if missing.
+
+    One race-safe round trip: the no-op DO UPDATE makes RETURNING yield the
+    existing row on conflict, where DO NOTHING would return nothing.
+    """
+    stmt = _UPSERT_INSERTS[db.get_bind().dialect.name](Wallet).values(
+        account_id=account_id, asset_type_id=asset_type_id, balance=Decimal("0")
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["account_id", "asset_type_id", "shard_index"],
+        set_={"account_id": stmt.excluded.account_id},
+    ).returning(Wallet.id, Wallet.balance, Wallet.version)
+    return db.execute(stmt).one()
+
+
+# Hot-path SELECTs are built once at import and bound per call, so each
+# request skips rebuilding the construct and goes straight to the compiled
+# SQL in the engine's cache. The balance UPDATEs stay per call: the ORM
+# synchronizes the session from their literal values, which bound-later
+# parameters would leave it unable to evaluate.
+_BALANCE_STMT = select(Wallet.balance).where(
+    Wallet.account_id == bindparam("aid"),
+    Wallet.asset_type_id == bindparam("tid"),
+    Wallet.shard_index == 0,
+)
 
 
-def _ensure_wallet(db: Session, account_id: UUID, asset_type_id: UUID) -> Wallet:
-    wallet = db.execute(
-        select(Wallet).where(
+def _atomic_debit(
+    db: Session, account_id: UUID, asset_type_id: UUID, amount: Decimal
+) -> Optional[Tuple[UUID, Decimal]]:
+    """Debit in one UPDATE ... RETURNING; None if the wallet is missing or short."""
+    return db.execute(
+        update(Wallet)
+        .where(
             Wallet.account_id == account_id,
             Wallet.asset_type_id == asset_type_id,
+            Wallet.shard_index == 0,
+            Wallet.balance >= amount,
         )
-    ).scalar_one_or_none()
+        .values(balance=Wallet.balance - amount, version=Wallet.version + 1, updated_at=db_now())
+        .returning(Wallet.id, Wallet.balance)
+    ).first()
+
 
-    if wallet is None:
-        wallet = Wallet(
-            account_id=account_id,
-            asset_type_id=asset_type_id,
-            balance=Decimal("0"),
+def _atomic_credit(
+    db: Session, account_id: UUID, asset_type_id: UUID, amount: Decimal, shard: int = 0
+) -> Optional[Tuple[UUID, Decimal]]:
+    """Credit in one UPDATE ... RETURNING; None if the wallet (shard) is missing."""
+    return db.execute(
+        update(Wallet)
+        .where(
+            Wallet.account_id == account_id,
+            Wallet.asset_type_id == asset_type_id,
+            Wallet.shard_index == shard,
         )
-        db.add(wallet)
-        db.flush()
-    return wallet
+        .values(balance=Wallet.balance + amount, version=Wallet.version + 1, updated_at=db_now())
+        .returning(Wallet.id, Wallet.balance)
+    ).first()
 
 
-def _apply_debit(
+def _transfer(
     db: Session,
-    wallet: Wallet,
+    src_account_id: UUID,
+    dst_account_id: UUID,
+    asset_type_id: UUID,
     amount: Decimal,
+    symbol: str,
+    dst_shard: int = 0,
+) -> Tuple[Tuple[UUID, Decimal], Tuple[UUID, Decimal]]:
+    """
+    Move `amount` between two wallets; returns (wallet_id, balance_after) per leg.
+
+    Each leg is a single guarded UPDATE, so the row lock is only held from the
+    UPDATE to commit and the database itself refuses to overdraw. Legs run in
+    account_id order so concurrent transfers over the same pair cannot
+    deadlock. A failed leg aborts the transfer; the caller's rollback undoes
+    the other one. A credit to a shard that has not been provisioned lands on
+    shard 0.
+    """
+    def debit():
+        leg = _atomic_debit(db, src_account_id, asset_type_id, amount)
+        if leg is None:
+            # Failure path only: find out whether the wallet is missing or short.
+            balance = db.execute(
+                _BALANCE_STMT, {"aid": src_account_id, "tid": asset_type_id}
+            ).scalar()
+            if balance is None:
+                raise WalletNotFoundError(str(src_account_id), str(asset_type_id))
+            raise InsufficientFundsError(float(balance), float(amount), symbol)
+        return tuple(leg)
+
+    def credit():
+        leg = _atomic_credit(db, dst_account_id, asset_type_id, amount, dst_shard)
+        if leg is None and dst_shard:
+            leg = _atomic_credit(db, dst_account_id, asset_type_id, amount)
+        if leg is None:
+            raise WalletNotFoundError(str(dst_account_id), str(asset_type_id))
+        return tuple(leg)
+
+    if src_account_id.bytes <= dst_account_id.bytes:
+        src_leg = debit()
+        dst_leg = credit()
+    else:
+        dst_leg = credit()
+        src_leg = debit()
+    return src_leg, dst_leg
+
+
+def _ledger_row(
+    wallet_id: UUID,
+    amount: Decimal,
+    balance_after: Decimal,
     ref_id: UUID,
-    tx_type: str,
+    tx_type: TransactionType,
     description: Optional[str],
     idempotency_key: Optional[str],
     metadata: Optional[dict],
-) -> Transaction:
-    new_balance = wallet.balance - amount
-    if new_balance < Decimal("0"):
-        raise NegativeBalanceError(str(wallet.id), float(new_balance))
-
-    wallet.balance = new_balance
-    wallet.version += 1
-    wallet.updated_at = datetime.now(timezone.utc)
-
-    tx = Transaction(
-        reference_id=ref_id,
-        transaction_type=tx_type,
-        wallet_id=wallet.id,
-        amount=-amount,
-        balance_after=new_balance,
-        description=description,
-        idempotency_key=idempotency_key,
-        metadata_=json.dumps(metadata) if metadata else None,
-    )
-    db.add(tx)
-    return tx
+) -> dict:
+    return {
+        "reference_id": ref_id,
+        "transaction_type": tx_type,
+        "wallet_id": wallet_id,
+        "amount": amount,
+        "balance_after": balance_after,
+        "description": description,
+        "idempotency_key": idempotency_key,
+        "metadata_": metadata,
+    }
 
 
-def _apply_credit(
+_PREFLIGHT_COLUMNS = (
+    select(Account.is_active)
+    .where(Account.id == bindparam("aid"))
+    .scalar_subquery().label("account_active"),
+    select(AssetType.symbol)
+    .where(AssetType.id == bindparam("tid"), AssetType.is_active == True)
+    .scalar_subquery().label("asset_symbol"),
+)
+_PREFLIGHT_STMT = select(*_PREFLIGHT_COLUMNS)
+_idem = select(IdempotencyKey).where(IdempotencyKey.key == bindparam("key")).subquery()
+_PREFLIGHT_IDEM_STMT = select(
+    *_PREFLIGHT_COLUMNS,
+    select(_idem.c.endpoint).scalar_subquery().label("idem_endpoint"),
+    # As text, so a JSONB column created by older releases is not decoded.
+    select(cast(_idem.c.response_body, Text)).scalar_subquery().label("idem_response"),
+)
+del _idem
+
+
+def _replay_if_cached(key: str, endpoint: str) -> None:
+    hit = idempotency_cache.lookup(key)
+    if hit is not None:
+        cached_endpoint, cached_body = hit
+        if cached_endpoint != endpoint:
+            raise IdempotencyConflictError(key)
+        raise DuplicateIdempotentRequestError(key, cached_body)
+
+
+def _preflight(
     db: Session,
-    wallet: Wallet,
-    amount: Decimal,
-    ref_id: UUID,
-    tx_type: str,
-    description: Optional[str],
     idempotency_key: Optional[str],
-    metadata: Optional[dict],
-) -> Transaction:
-    new_balance = wallet.balance + amount
-
-    wallet.balance = new_balance
-    wallet.version += 1
-    wallet.updated_at = datetime.now(timezone.utc)
-
-    tx = Transaction(
-        reference_id=ref_id,
-        transaction_type=tx_type,
-        wallet_id=wallet.id,
-        amount=amount,
-        balance_after=new_balance,
-        description=description,
-        idempotency_key=idempotency_key,
-        metadata_=json.dumps(metadata) if metadata else None,
-    )
-    db.add(tx)
-    return tx
+    endpoint: str,
+    user_account_id: UUID,
+    asset_type_id: UUID,
+) -> str:
+    """
+    Run every pre-lock check of a mutating flow in a single round trip.
+
+    Raises, in this order: IdempotencyConflictError or
+    DuplicateIdempotentRequestError for a used key, AccountNotFoundError,
+    AssetTypeNotFoundError. Returns the asset's symbol.
+    """
+    if idempotency_key:
+        _replay_if_cached(idempotency_key, endpoint)
 
+    if idempotency_key:
+        row = db.execute(
+            _PREFLIGHT_IDEM_STMT,
+            {"aid": user_account_id, "tid": asset_type_id, "key": idempotency_key},
+        ).one()
+    else:
+        row = db.execute(
+            _PREFLIGHT_STMT, {"aid": user_account_id, "tid": asset_type_id}
+        ).one()
+
+    if idempotency_key and row.idem_endpoint is not None:
+        if row.idem_endpoint != endpoint:
+            raise IdempotencyConflictError(idempotency_key)
+        raise DuplicateIdempotentRequestError(idempotency_key, row.idem_response)
+    if not row.account_active:
+        raise AccountNotFoundError(str(user_account_id))
+    if row.asset_symbol is None:
+        raise AssetTypeNotFoundError(str(asset_type_id))
+    return row.asset_symbol
 
-def _check_idempotency(db: Session, key: str, endpoint: str) -> Optional[dict]:
-    record = db.execute(
-        select(IdempotencyKey).where(IdempotencyKey.key == key)
-    ).scalar_one_or_none()
 
-    if record is None:
-        return None
+def _result(
+    ref_id: UUID, tx_type: str, amount: Decimal, balance_after: Decimal, message: str
+) -> dict:
+    """The flow's outcome, shaped exactly like the TransactionResponse JSON body."""
+    return {
+        "status": "success",
+        "reference_id": str(ref_id),
+        "transaction_type": tx_type,
+        "amount": str(amount),
+        "amount_minor": to_minor(amount),
+        "balance_after": str(balance_after),
+        "balance_after_minor": to_minor(balance_after),
+        "message": message,
+    }
 
-    if record.endpoint != endpoint:
-        raise IdempotencyConflictError(key)
 
-    return json.loads(record.response_body)
+_IDEM_WINNER_STMT = select(
+    IdempotencyKey.endpoint, cast(IdempotencyKey.response_body, Text).label("body")
+).where(IdempotencyKey.key == bindparam("key"))
 
 
 def _store_idempotency(
@@ -173,14 +372,41 @@ def _store_idempotency(
     response: dict,
     ttl_hours: int = None,
 ) -> None:
+    """
+    Record the flow's response under its key, or defer to a concurrent winner.
+
+    Two requests with the same new key both pass _preflight; the INSERT ...
+    ON CONFLICT DO NOTHING makes the later one wait for the earlier to commit
+    and then insert nothing, so it raises with the winner's response instead
+    of failing on the unique index. The caller's rollback discards its work.
+    """
+    # Encoded once here; replays send these bytes back verbatim.
+    body = orjson.dumps(response).decode()
     ttl = ttl_hours or settings.IDEMPOTENCY_KEY_TTL_HOURS
-    record = IdempotencyKey(
+    stmt = _UPSERT_INSERTS[db.get_bind().dialect.name](IdempotencyKey).values(
         key=key,
         endpoint=endpoint,
-        response_body=json.dumps(response, default=str),
-        expires_at=datetime.now(timezone.utc) + timedelta(hours=ttl),
+        response_body=body,
+        expires_at=db_hours_from_now(ttl),
+    )
+    stored = db.execute(
+        stmt.on_conflict_do_nothing(index_elements=["key"]).returning(IdempotencyKey.id)
+    ).first()
+    if stored is None:
+        winner = db.execute(_IDEM_WINNER_STMT, {"key": key}).one()
+        if winner.endpoint != endpoint:
+            raise IdempotencyConflictError(key)
+        raise DuplicateIdempotentRequestError(key, winner.body)
+    idempotency_cache.stage(db, key, endpoint, body)
+
+
+def purge_expired_idempotency_keys(db: Session) -> int:
+    result = db.execute(
+        delete(IdempotencyKey)
+        .where(IdempotencyKey.expires_at < db_now())
+        .execution_options(synchronize_session=False)
     )
-    db.add(record)
+    return result.rowcount
 
 
 def top_up(
@@ -194,42 +420,25 @@ def top_up(
 ) -> dict:
     ENDPOINT = "top_up"
 
-    if idempotency_key:
-        cached = _check_idempotency(db, idempotency_key, ENDPOINT)
-        if cached is not None:
-            raise DuplicateIdempotentRequestError(idempotency_key, cached)
-
-    _get_active_account(db, user_account_id)
-    asset = _get_active_asset_type(db, asset_type_id)
-    treasury = _get_system_account(db, SYSTEM_TREASURY)
-
-    src_wallet = _lock_wallet(db, treasury.id, asset_type_id)
-    dst_wallet = _lock_wallet(db, user_account_id, asset_type_id)
+    symbol = _preflight(db, idempotency_key, ENDPOINT, user_account_id, asset_type_id)
+    treasury_id = _get_system_account_id(db, SYSTEM_TREASURY)
 
-    if src_wallet.balance < amount:
-        raise InsufficientFundsError(
-            float(src_wallet.balance), float(amount), asset.symbol
-        )
+    (src_wallet_id, src_balance), (dst_wallet_id, dst_balance) = _transfer(
+        db, treasury_id, user_account_id, asset_type_id, amount, symbol
+    )
 
-    ref_id = uuid.uuid4()
+    ref_id = uuid7()
     metadata = {"payment_reference": payment_reference} if payment_reference else None
 
-    _apply_debit(db, src_wallet, amount, ref_id, "TOPUP",
-                 f"Treasury debit for top-up: {description or ''}",
-                 idempotency_key, metadata)
-    credit_tx = _apply_credit(db, dst_wallet, amount, ref_id, "TOPUP",
-                               description or f"Top-up of {amount} {asset.symbol}",
-                               idempotency_key, metadata)
+    Transaction.insert_many(db, [
+        _ledger_row(src_wallet_id, -amount, src_balance, ref_id, TransactionType.TOPUP,
+                    f"Treasury debit for top-up: {description or ''}", idempotency_key, metadata),
+        _ledger_row(dst_wallet_id, amount, dst_balance, ref_id, TransactionType.TOPUP,
+                    description or f"Top-up of {amount} {symbol}", idempotency_key, metadata),
+    ])
 
-    db.flush()
-
-    result = {
-        "reference_id": str(ref_id),
-        "transaction_type": "TOPUP",
-        "amount": str(amount),
-        "balance_after": str(credit_tx.balance_after),
-        "message": f"Successfully credited {amount} {asset.symbol} to your wallet.",
-    }
+    result = _result(ref_id, "TOPUP", amount, dst_balance,
+                     f"Successfully credited {amount} {symbol} to your wallet.")
 
     if idempotency_key:
         _store_idempotency(db, idempotency_key, ENDPOINT, result)
@@ -248,41 +457,152 @@ def issue_bonus(
 ) -> dict:
     ENDPOINT = "issue_bonus"
 
+    symbol = _preflight(db, idempotency_key, ENDPOINT, user_account_id, asset_type_id)
+    bonus_pool_id = _get_system_account_id(db, SYSTEM_BONUS_POOL)
+
+    (src_wallet_id, src_balance), (dst_wallet_id, dst_balance) = _transfer(
+        db, bonus_pool_id, user_account_id, asset_type_id, amount, symbol
+    )
+
+    ref_id = uuid7()
+    metadata = {"reason": reason} if reason else None
+
+    Transaction.insert_many(db, [
+        _ledger_row(src_wallet_id, -amount, src_balance, ref_id, TransactionType.BONUS,
+                    f"Bonus pool debit: {reason or ''}", idempotency_key, metadata),
+        _ledger_row(dst_wallet_id, amount, dst_balance, ref_id, TransactionType.BONUS,
+                    description or f"Bonus: {reason or 'system grant'} — {amount} {symbol}", idempotency_key, metadata),
+    ])
+
+    result = _result(ref_id, "BONUS", amount, dst_balance,
+                     f"Bonus of {amount} {symbol} issued successfully.")
+
     if idempotency_key:
-        cached = _check_idempotency(db, idempotency_key, ENDPOINT)
-        if cached is not None:
-            raise DuplicateIdempotentRequestError(idempotency_key, cached)
+        _store_idempotency(db, idempotency_key, ENDPOINT, result)
 
-    _get_active_account(db, user_account_id)
-    asset = _get_active_asset_type(db, asset_type_id)
-    bonus_pool = _get_system_account(db, SYSTEM_BONUS_POOL)
+    return result
+
+
+# Locks every wallet a bulk grant touches, pool included, in account_id order:
+# the same order _transfer takes its two locks in, so bulk and single grants
+# cannot deadlock each other (FOR NO KEY UPDATE is dropped on SQLite).
+_BULK_WALLET_LOCK_STMT = (
+    select(Wallet.account_id)
+    .join(Account, Account.id == Wallet.account_id)
+    .where(
+        Wallet.account_id.in_(bindparam("aids", expanding=True)),
+        Wallet.asset_type_id == bindparam("tid"),
+        Wallet.shard_index == 0,
+        Account.is_active == True,
+    )
+    .order_by(Wallet.account_id)
+    .with_for_update(of=Wallet, key_share=True)
+)
+
+
+def issue_bonus_bulk(
+    db: Session,
+    recipients: Sequence[Tuple[UUID, Decimal]],
+    asset_type_id: UUID,
+    reason: Optional[str] = None,
+    description: Optional[str] = None,
+    idempotency_key: Optional[str] = None,
+) -> dict:
+    """
+    Grant bonuses to many users as one transfer from the bonus pool.
 
-    src_wallet = _lock_wallet(db, bonus_pool.id, asset_type_id)
-    dst_wallet = _lock_wallet(db, user_account_id, asset_type_id)
+    The statement count does not grow with the batch: one lock query, one
+    guarded debit of the pool by the total, one UPDATE crediting every user
+    wallet, and one ledger insert under a shared reference_id. Repeated
+    account ids are merged into a single credit.
+    """
+    ENDPOINT = "issue_bonus_bulk"
 
-    if src_wallet.balance < amount:
-        raise InsufficientFundsError(
-            float(src_wallet.balance), float(amount), asset.symbol
+    if idempotency_key:
+        _replay_if_cached(idempotency_key, ENDPOINT)
+        used = db.execute(_IDEM_WINNER_STMT, {"key": idempotency_key}).first()
+        if used is not None:
+            if used.endpoint != ENDPOINT:
+                raise IdempotencyConflictError(idempotency_key)
+            raise DuplicateIdempotentRequestError(idempotency_key, used.body)
+
+    symbol = _get_active_asset_type(db, asset_type_id).symbol
+    bonus_pool_id = _get_system_account_id(db, SYSTEM_BONUS_POOL)
+
+    amounts: Dict[UUID, Decimal] = {}
+    for account_id, amount in recipients:
+        amounts[account_id] = amounts.get(account_id, Decimal("0")) + amount
+    total = sum(amounts.values(), Decimal("0"))
+
+    locked = set(db.execute(
+        _BULK_WALLET_LOCK_STMT, {"aids": [bonus_pool_id, *amounts], "tid": asset_type_id}
+    ).scalars())
+    for account_id in (bonus_pool_id, *amounts):
+        if account_id not in locked:
+            _get_active_account(db, account_id)
+            raise WalletNotFoundError(str(account_id), str(asset_type_id))
+
+    pool_leg = _atomic_debit(db, bonus_pool_id, asset_type_id, total)
+    if pool_leg is None:
+        balance = db.execute(
+            _BALANCE_STMT, {"aid": bonus_pool_id, "tid": asset_type_id}
+        ).scalar()
+        raise InsufficientFundsError(float(balance), float(total), symbol)
+    pool_wallet_id, pool_balance = pool_leg
+
+    credited = {
+        row.account_id: row
+        for row in db.execute(
+            update(Wallet)
+            .where(
+                Wallet.account_id.in_(list(amounts)),
+                Wallet.asset_type_id == asset_type_id,
+                Wallet.shard_index == 0,
+            )
+            .values(
+                balance=Wallet.balance + case(
+                    *((Wallet.account_id == account_id, amount)
+                      for account_id, amount in amounts.items())
+                ),
+                version=Wallet.version + 1,
+                updated_at=db_now(),
+            )
+            .returning(Wallet.id, Wallet.account_id, Wallet.balance)
         )
+    }
 
-    ref_id = uuid.uuid4()
+    ref_id = uuid7()
     metadata = {"reason": reason} if reason else None
 
-    _apply_debit(db, src_wallet, amount, ref_id, "BONUS",
-                 f"Bonus pool debit: {reason or ''}",
-                 idempotency_key, metadata)
-    credit_tx = _apply_credit(db, dst_wallet, amount, ref_id, "BONUS",
-                               description or f"Bonus: {reason or 'system grant'} — {amount} {asset.symbol}",
-                               idempotency_key, metadata)
-
-    db.flush()
+    Transaction.insert_many(db, [
+        _ledger_row(pool_wallet_id, -total, pool_balance, ref_id, TransactionType.BONUS,
+                    f"Bulk bonus pool debit: {reason or ''}", idempotency_key, metadata),
+        *(
+            _ledger_row(credited[account_id].id, amount, credited[account_id].balance, ref_id,
+                        TransactionType.BONUS,
+                        description or f"Bonus: {reason or 'system grant'} — {amount} {symbol}",
+                        idempotency_key, metadata)
+            for account_id, amount in amounts.items()
+        ),
+    ])
 
     result = {
+        "status": "success",
         "reference_id": str(ref_id),
         "transaction_type": "BONUS",
-        "amount": str(amount),
-        "balance_after": str(credit_tx.balance_after),
-        "message": f"Bonus of {amount} {asset.symbol} issued successfully.",
+        "amount": str(total),
+        "amount_minor": to_minor(total),
+        "recipients": [
+            {
+                "user_account_id": str(account_id),
+                "amount": str(amount),
+                "amount_minor": to_minor(amount),
+                "balance_after": str(credited[account_id].balance),
+                "balance_after_minor": to_minor(credited[account_id].balance),
+            }
+            for account_id, amount in amounts.items()
+        ],
+        "message": f"Bonus of {total} {symbol} issued to {len(amounts)} accounts.",
     }
 
     if idempotency_key:
@@ -302,43 +622,26 @@ def spend(
 ) -> dict:
     ENDPOINT = "spend"
 
-    if idempotency_key:
-        cached = _check_idempotency(db, idempotency_key, ENDPOINT)
-        if cached is not None:
-            raise DuplicateIdempotentRequestError(idempotency_key, cached)
-
-    _get_active_account(db, user_account_id)
-    asset = _get_active_asset_type(db, asset_type_id)
-    revenue = _get_system_account(db, SYSTEM_REVENUE)
-
-    src_wallet = _lock_wallet(db, user_account_id, asset_type_id)
-
-    if src_wallet.balance < amount:
-        raise InsufficientFundsError(
-            float(src_wallet.balance), float(amount), asset.symbol
-        )
+    symbol = _preflight(db, idempotency_key, ENDPOINT, user_account_id, asset_type_id)
+    revenue_id = _get_system_account_id(db, SYSTEM_REVENUE)
 
-    dst_wallet = _lock_wallet(db, revenue.id, asset_type_id)
+    (src_wallet_id, src_balance), (dst_wallet_id, dst_balance) = _transfer(
+        db, user_account_id, revenue_id, asset_type_id, amount, symbol,
+        dst_shard=_revenue_shard(user_account_id),
+    )
 
-    ref_id = uuid.uuid4()
+    ref_id = uuid7()
     metadata = {"item_reference": item_reference} if item_reference else None
 
-    debit_tx = _apply_debit(db, src_wallet, amount, ref_id, "SPEND",
-                             description or f"Spent {amount} {asset.symbol}",
-                             idempotency_key, metadata)
-    _apply_credit(db, dst_wallet, amount, ref_id, "SPEND",
-                  f"Revenue credit from spend: {item_reference or ''}",
-                  idempotency_key, metadata)
-
-    db.flush()
+    Transaction.insert_many(db, [
+        _ledger_row(src_wallet_id, -amount, src_balance, ref_id, TransactionType.SPEND,
+                    description or f"Spent {amount} {symbol}", idempotency_key, metadata),
+        _ledger_row(dst_wallet_id, amount, dst_balance, ref_id, TransactionType.SPEND,
+                    f"Revenue credit from spend: {item_reference or ''}", idempotency_key, metadata),
+    ])
 
-    result = {
-        "reference_id": str(ref_id),
-        "transaction_type": "SPEND",
-        "amount": str(amount),
-        "balance_after": str(debit_tx.balance_after),
-        "message": f"Successfully spent {amount} {asset.symbol}.",
-    }
+    result = _result(ref_id, "SPEND", amount, src_balance,
+                     f"Successfully spent {amount} {symbol}.")
 
     if idempotency_key:
         _store_idempotency(db, idempotency_key, ENDPOINT, result)
@@ -346,71 +649,151 @@ def spend(
     return result
 
 
+_BALANCE_VIEW_STMT = (
+    select(
+        Account.id,
+        Account.username,
+        Account.is_active,
+        func.count(Wallet.id).label("wallets"),
+        func.sum(Wallet.balance).label("balance"),
+    )
+    .outerjoin(
+        Wallet,
+        and_(Wallet.account_id == Account.id, Wallet.asset_type_id == bindparam("tid")),
+    )
+    .where(Account.id == bindparam("aid"))
+    .group_by(Account.id, Account.username, Account.is_active)
+)
+
+
 def get_balance(
     db: Session,
     account_id: UUID,
     asset_type_id: UUID,
-) -> Tuple[Wallet, Account, AssetType]:
-    account = _get_active_account(db, account_id)
+) -> Tuple[Decimal, Row, Row]:
+    """
+    Balance of the account's wallet, summed over its shards.
+
+    Returns (balance, account, asset) where account is an (id, username,
+    is_active) row and asset an (id, name, symbol) row; plain rows, since
+    nothing here needs ORM identity or change tracking.
+    """
+    account = db.execute(_BALANCE_VIEW_STMT, {"aid": account_id, "tid": asset_type_id}).first()
+    if account is None or not account.is_active:
+        raise AccountNotFoundError(str(account_id))
     asset = _get_active_asset_type(db, asset_type_id)
+    if not account.wallets:
+        raise WalletNotFoundError(str(account_id), str(asset_type_id))
 
-    wallet = db.execute(
-        select(Wallet).where(
-            Wallet.account_id == account_id,
-            Wallet.asset_type_id == asset_type_id,
-        )
-    ).scalar_one_or_none()
+    return account.balance, account, asset
 
-    if wallet is None:
-        raise WalletNotFoundError(str(account_id), str(asset_type_id))
 
-    return wallet, account, asset
+def encode_cursor(tx_id: UUID) -> str:
+    return base64.urlsafe_b64encode(tx_id.bytes).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor: str) -> UUID:
+    try:
+        return UUID(bytes=base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, binascii.Error):
+        raise InvalidCursorError(cursor)
+
+
+# Exactly what TransactionOut serialises, fetched as row columns.
+_HISTORY_COLUMNS = (
+    Transaction.id,
+    Transaction.reference_id,
+    Transaction.transaction_type_name.label("transaction_type_name"),
+    Transaction.wallet_id,
+    Transaction.amount,
+    Transaction.balance_after,
+    Transaction.description,
+    Transaction.idempotency_key,
+    Transaction.created_at,
+)
 
 
-def get_transaction_history(
+def get_transaction_history_with_asset(
     db: Session,
     account_id: UUID,
     asset_type_id: UUID,
     limit: int = 50,
-    offset: int = 0,
-) -> Tuple[list, int]:
-    _get_active_account(db, account_id)
-    _get_active_asset_type(db, asset_type_id)
-
-    wallet = db.execute(
-        select(Wallet).where(
-            Wallet.account_id == account_id,
-            Wallet.asset_type_id == asset_type_id,
+    cursor: Optional[str] = None,
+) -> Tuple[list, int, Optional[str], str, str]:
+    """
+    Keyset-paginated history, newest first, plus the asset's name and symbol.
+
+    One statement on the happy path: a CTE resolves the asset and checks
+    that the account is active and has the wallet, the page is outer-joined to
+    it so a wallet without transactions still yields a row, and the total
+    rides along as a scalar subquery. Sharded system wallets are read across
+    all their rows. The cursor is the id of the last transaction on the
+    previous page; its created_at is looked up inline, so a page is an index
+    range scan on (wallet_id, created_at, id) at any depth. Returns
+    (txs, total, next_cursor, asset_name, asset_symbol).
+    """
+    wallet_ids = select(Wallet.id).where(
+        Wallet.account_id == account_id, Wallet.asset_type_id == asset_type_id
+    )
+    w = (
+        select(AssetType.name, AssetType.symbol)
+        .where(
+            AssetType.id == asset_type_id,
+            AssetType.is_active == True,
+            select(Account.id).where(Account.id == account_id, Account.is_active == True).exists(),
+            wallet_ids.exists(),
         )
-    ).scalar_one_or_none()
-
-    if wallet is None:
+        .cte("w")
+    )
+    total = (
+        select(func.count(Transaction.id))
+        .where(Transaction.wallet_id.in_(wallet_ids))
+        .correlate(None)
+        .scalar_subquery()
+    )
+    on = Transaction.wallet_id.in_(wallet_ids)
+    if cursor is not None:
+        after_id = decode_cursor(cursor)
+        prev = aliased(Transaction)
+        after_ts = select(prev.created_at).where(prev.id == after_id).scalar_subquery()
+        on = and_(on, tuple_(Transaction.created_at, Transaction.id) < tuple_(after_ts, after_id))
+
+    rows = db.execute(
+        select(w.c.name, w.c.symbol, total.label("total"), *_HISTORY_COLUMNS)
+        .select_from(w)
+        .outerjoin(Transaction, on)
+        .order_by(Transaction.created_at.desc(), Transaction.id.desc())
+        .limit(limit + 1)
+    ).all()
+
+    if not rows:
+        # Error path only: re-check in order to raise the specific error.
+        _get_active_account(db, account_id)
+        _get_active_asset_type(db, asset_type_id)
         raise WalletNotFoundError(str(account_id), str(asset_type_id))
 
-    from sqlalchemy import func
-    total = db.execute(
-        select(func.count(Transaction.id)).where(Transaction.wallet_id == wallet.id)
-    ).scalar()
+    txs = [row for row in rows[:limit] if row.id is not None]
+    next_cursor = encode_cursor(txs[-1].id) if len(rows) > limit else None
+    return txs, rows[0].total, next_cursor, rows[0].name, rows[0].symbol
 
-    txs = db.execute(
-        select(Transaction)
-        .where(Transaction.wallet_id == wallet.id)
-        .order_by(Transaction.created_at.desc())
-        .limit(limit)
-        .offset(offset)
-    ).scalars().all()
 
-    return txs, total
+# The list endpoints only serialise these columns, so they are fetched as
+# plain rows rather than ORM instances.
+_ASSET_TYPE_LIST_STMT = select(
+    AssetType.id, AssetType.name, AssetType.symbol, AssetType.description, AssetType.is_active
+).where(AssetType.is_active == True)
+_ACCOUNT_LIST_STMT = select(
+    Account.id, Account.username, Account.email, Account.is_system, Account.is_active,
+    Account.created_at,
+).where(Account.is_active == True)
 
 
 def list_asset_types(db: Session) -> list:
-    return db.execute(
-        select(AssetType).where(AssetType.is_active == True)
-    ).scalars().all()
+    return db.execute(_ASSET_TYPE_LIST_STMT).all()
 
 
 def list_accounts(db: Session, include_system: bool = False) -> list:
-    q = select(Account).where(Account.is_active == True)
+    q = _ACCOUNT_LIST_STMT
     if not include_system:
         q = q.where(Account.is_system == False)
-    return db.execute(q).scalars().all()
+    return db.execute(q).all()
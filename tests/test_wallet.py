@@ -12,9 +12,12 @@ import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 
 from app.main import app
-from app.database import get_db
+from app.database import get_db, get_db_read
+from app.routers.wallet import invalidate_catalog_cache
+from app import idempotency_cache
 from app.models import Base, Account, AssetType, Wallet, Transaction
 from app.exceptions import InsufficientFundsError
 
@@ -23,28 +26,89 @@ from app.exceptions import InsufficientFundsError
 # Test fixtures — SQLite in-memory DB
 # ──────────────────────────────────────────────────────────────────────────────
 
-TEST_DB_URL = "sqlite:///:memory:"
+# One named in-memory database, shared by every connection of the engine.
+# Each pytest-xdist worker gets its own (`pytest -n auto`).
+TEST_DB_URL = "sqlite:///file:wallet_test_{worker}?mode=memory&cache=shared&uri=true"
 
 # SQLite doesn't support FOR UPDATE — we patch it for unit tests
 import sqlalchemy
 _orig_compile = None
 
 
+# Deterministic ids of the rows inserted by `seeded_engine`.
+SEED_IDS = {
+    "gc": uuid.UUID("a1000000-0000-0000-0000-000000000001"),
+    "treasury": uuid.UUID("b1000000-0000-0000-0000-000000000001"),
+    "bonus_pool": uuid.UUID("b1000000-0000-0000-0000-000000000002"),
+    "revenue": uuid.UUID("b1000000-0000-0000-0000-000000000003"),
+    "alice": uuid.UUID("c1000000-0000-0000-0000-000000000001"),
+    "treasury_wallet": uuid.UUID("e1000000-0000-0000-0000-000000000001"),
+    "bonus_wallet": uuid.UUID("e1000000-0000-0000-0000-000000000004"),
+    "revenue_wallet": uuid.UUID("e1000000-0000-0000-0000-000000000007"),
+    "alice_wallet": uuid.UUID("e2000000-0000-0000-0000-000000000001"),
+}
+
+
 @pytest.fixture(scope="session")
-def engine_fixture():
+def engine_fixture(request):
     """Create an in-memory SQLite engine and build all tables."""
+    worker = getattr(request.config, "workerinput", {}).get("workerid", "master")
     engine = create_engine(
-        TEST_DB_URL,
+        TEST_DB_URL.format(worker=worker),
         connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
     )
     Base.metadata.create_all(bind=engine)
     return engine
 
 
+@pytest.fixture(scope="session")
+def seeded_engine(engine_fixture):
+    """Insert minimal seed data once; each test's rollback leaves it untouched."""
+    Session = sessionmaker(bind=engine_fixture)
+    with Session() as session:
+        # Asset types
+        gc = AssetType(id=SEED_IDS["gc"], name="Gold Coins", symbol="GC", is_active=True)
+
+        # System accounts
+        treasury = Account(
+            id=SEED_IDS["treasury"], username="system_treasury", is_system=True, is_active=True,
+        )
+        bonus_pool = Account(
+            id=SEED_IDS["bonus_pool"], username="system_bonus_pool", is_system=True, is_active=True,
+        )
+        revenue = Account(
+            id=SEED_IDS["revenue"], username="system_revenue", is_system=True, is_active=True,
+        )
+
+        # User account
+        alice = Account(
+            id=SEED_IDS["alice"],
+            username="alice", email="alice@test.com", is_system=False, is_active=True,
+        )
+
+        # Wallets  (IDs use only valid hex characters — no 'w' prefix)
+        wallets = [
+            Wallet(id=SEED_IDS["treasury_wallet"], account_id=treasury.id,
+                   asset_type_id=gc.id, balance=Decimal("99999999")),
+            Wallet(id=SEED_IDS["bonus_wallet"], account_id=bonus_pool.id,
+                   asset_type_id=gc.id, balance=Decimal("99999999")),
+            Wallet(id=SEED_IDS["revenue_wallet"], account_id=revenue.id,
+                   asset_type_id=gc.id, balance=Decimal("0")),
+            Wallet(id=SEED_IDS["alice_wallet"], account_id=alice.id,
+                   asset_type_id=gc.id, balance=Decimal("500")),
+        ]
+
+        # One add_all; the unit of work orders the INSERTs by foreign key.
+        session.add_all([gc, treasury, bonus_pool, revenue, alice, *wallets])
+        session.commit()
+    return engine_fixture
+
+
 @pytest.fixture()
-def db_session(engine_fixture):
+def db_session(seeded_engine):
     """Provide a clean database session per test, rolled back afterwards."""
-    connection = engine_fixture.connect()
+    connection = seeded_engine.connect()
     transaction = connection.begin()
     TestSession = sessionmaker(bind=connection, autocommit=False, autoflush=False)
     session = TestSession()
@@ -58,97 +122,53 @@ def db_session(engine_fixture):
 
 @pytest.fixture()
 def seed_data(db_session):
-    """Insert minimal seed data into the test DB."""
-    # Asset types
-    gc = AssetType(
-        id=uuid.UUID("a1000000-0000-0000-0000-000000000001"),
-        name="Gold Coins", symbol="GC", is_active=True,
-    )
-    db_session.add(gc)
-
-    # System accounts
-    treasury = Account(
-        id=uuid.UUID("b1000000-0000-0000-0000-000000000001"),
-        username="system_treasury", is_system=True, is_active=True,
-    )
-    bonus_pool = Account(
-        id=uuid.UUID("b1000000-0000-0000-0000-000000000002"),
-        username="system_bonus_pool", is_system=True, is_active=True,
-    )
-    revenue = Account(
-        id=uuid.UUID("b1000000-0000-0000-0000-000000000003"),
-        username="system_revenue", is_system=True, is_active=True,
-    )
-    db_session.add_all([treasury, bonus_pool, revenue])
-
-    # User account
-    alice = Account(
-        id=uuid.UUID("c1000000-0000-0000-0000-000000000001"),
-        username="alice", email="alice@test.com", is_system=False, is_active=True,
-    )
-    db_session.add(alice)
-
-    # Wallets  (IDs use only valid hex characters — no 'w' prefix)
-    treasury_wallet = Wallet(
-        id=uuid.UUID("e1000000-0000-0000-0000-000000000001"),
-        account_id=treasury.id, asset_type_id=gc.id,
-        balance=Decimal("99999999"),
-    )
-    bonus_wallet = Wallet(
-        id=uuid.UUID("e1000000-0000-0000-0000-000000000004"),
-        account_id=bonus_pool.id, asset_type_id=gc.id,
-        balance=Decimal("99999999"),
-    )
-    revenue_wallet = Wallet(
-        id=uuid.UUID("e1000000-0000-0000-0000-000000000007"),
-        account_id=revenue.id, asset_type_id=gc.id,
-        balance=Decimal("0"),
-    )
-    alice_wallet = Wallet(
-        id=uuid.UUID("e2000000-0000-0000-0000-000000000001"),
-        account_id=alice.id, asset_type_id=gc.id,
-        balance=Decimal("500"),
-    )
-    db_session.add_all([treasury_wallet, bonus_wallet, revenue_wallet, alice_wallet])
-    db_session.flush()
-
-    return {
-        "gc": gc,
-        "treasury": treasury,
-        "bonus_pool": bonus_pool,
-        "revenue": revenue,
-        "alice": alice,
-        "treasury_wallet": treasury_wallet,
-        "bonus_wallet": bonus_wallet,
-        "revenue_wallet": revenue_wallet,
-        "alice_wallet": alice_wallet,
+    """The seed rows, loaded into the test's session."""
+    rows = {
+        AssetType: db_session.query(AssetType).filter(AssetType.id == SEED_IDS["gc"]).all(),
+        Account: db_session.query(Account).filter(Account.id.in_([
+            SEED_IDS["treasury"], SEED_IDS["bonus_pool"], SEED_IDS["revenue"], SEED_IDS["alice"],
+        ])).all(),
+        Wallet: db_session.query(Wallet).filter(Wallet.id.in_([
+            SEED_IDS["treasury_wallet"], SEED_IDS["bonus_wallet"],
+            SEED_IDS["revenue_wallet"], SEED_IDS["alice_wallet"],
+        ])).all(),
     }
+    by_id = {row.id: row for group in rows.values() for row in group}
+    return {name: by_id[seed_id] for name, seed_id in SEED_IDS.items()}
 
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Service-layer unit tests
 # ──────────────────────────────────────────────────────────────────────────────
 
-class TestTopUp:
-    def test_top_up_increases_balance(self, db_session, seed_data):
-        from app.service import top_up
-        result = top_up(
+@pytest.mark.unit
+class TestFlowBalances:
+    @pytest.mark.parametrize("flow,amount,expected,tx_type", [
+        ("top_up", "100", "600", "TOPUP"),       # 500 + 100
+        ("issue_bonus", "75", "575", "BONUS"),   # 500 + 75
+        ("spend", "30", "470", "SPEND"),         # 500 - 30
+    ])
+    def test_flow_moves_user_balance(self, db_session, seed_data, flow, amount, expected, tx_type):
+        import app.service as svc
+        result = getattr(svc, flow)(
             db=db_session,
             user_account_id=seed_data["alice"].id,
             asset_type_id=seed_data["gc"].id,
-            amount=Decimal("100"),
-            description="Test top-up",
+            amount=Decimal(amount),
         )
         db_session.flush()
 
-        assert result["transaction_type"] == "TOPUP"
-        assert Decimal(result["amount"]) == Decimal("100")
-        assert Decimal(result["balance_after"]) == Decimal("600")  # 500 + 100
+        assert result["transaction_type"] == tx_type
+        assert Decimal(result["amount"]) == Decimal(amount)
+        assert Decimal(result["balance_after"]) == Decimal(expected)
 
         # Verify wallet balance updated
         alice_wallet = db_session.get(Wallet, seed_data["alice_wallet"].id)
-        assert alice_wallet.balance == Decimal("600")
+        assert alice_wallet.balance == Decimal(expected)
+
 
+@pytest.mark.unit
+class TestTopUp:
     def test_top_up_creates_two_ledger_entries(self, db_session, seed_data):
         from app.service import top_up
         result = top_up(
@@ -194,37 +214,68 @@ class TestTopUp:
         assert exc_info.value.cached_response["reference_id"] == result1["reference_id"]
 
 
-class TestBonus:
-    def test_bonus_increases_balance(self, db_session, seed_data):
-        from app.service import issue_bonus
-        result = issue_bonus(
+    def test_concurrent_key_defers_to_first_writer(self, db_session, seed_data):
+        from app.service import _store_idempotency
+        from app.exceptions import DuplicateIdempotentRequestError, IdempotencyConflictError
+        key = f"idem-race-{uuid.uuid4()}"
+        _store_idempotency(db_session, key, "top_up", {"reference_id": "first"})
+
+        with pytest.raises(DuplicateIdempotentRequestError) as exc_info:
+            _store_idempotency(db_session, key, "top_up", {"reference_id": "second"})
+        assert exc_info.value.cached_response == {"reference_id": "first"}
+
+        with pytest.raises(IdempotencyConflictError):
+            _store_idempotency(db_session, key, "spend", {"reference_id": "third"})
+
+
+@pytest.mark.unit
+class TestBonusBulk:
+    def _add_bob(self, db_session, seed_data):
+        bob = Account(username="bob", is_system=False, is_active=True)
+        db_session.add(bob)
+        db_session.flush()
+        db_session.add(Wallet(account_id=bob.id, asset_type_id=seed_data["gc"].id, balance=Decimal("0")))
+        db_session.flush()
+        return bob
+
+    def test_bulk_bonus_credits_all_and_debits_pool_once(self, db_session, seed_data):
+        from sqlalchemy import select
+        from app.service import issue_bonus_bulk
+        bob = self._add_bob(db_session, seed_data)
+        alice = seed_data["alice"]
+        result = issue_bonus_bulk(
             db=db_session,
-            user_account_id=seed_data["alice"].id,
+            recipients=[(alice.id, Decimal("10")), (bob.id, Decimal("20")), (alice.id, Decimal("5"))],
             asset_type_id=seed_data["gc"].id,
-            amount=Decimal("75"),
-            reason="Referral reward",
+            reason="Launch gift",
         )
         db_session.flush()
 
-        assert result["transaction_type"] == "BONUS"
-        assert Decimal(result["balance_after"]) == Decimal("575")  # 500 + 75
+        assert Decimal(result["amount"]) == Decimal("35")
+        by_account = {r["user_account_id"]: Decimal(r["balance_after"]) for r in result["recipients"]}
+        assert by_account == {str(alice.id): Decimal("515"), str(bob.id): Decimal("20")}
 
+        rows = db_session.execute(
+            select(Transaction.amount).where(Transaction.reference_id == uuid.UUID(result["reference_id"]))
+        ).scalars().all()
+        assert sorted(rows) == [Decimal("-35"), Decimal("15"), Decimal("20")]
 
-class TestSpend:
-    def test_spend_decreases_balance(self, db_session, seed_data):
-        from app.service import spend
-        result = spend(
-            db=db_session,
-            user_account_id=seed_data["alice"].id,
-            asset_type_id=seed_data["gc"].id,
-            amount=Decimal("30"),
-            description="Bought power-up",
-        )
+    def test_bulk_bonus_rejects_recipient_without_wallet(self, db_session, seed_data):
+        from app.exceptions import WalletNotFoundError
+        from app.service import issue_bonus_bulk
+        carol = Account(username="carol", is_system=False, is_active=True)
+        db_session.add(carol)
         db_session.flush()
+        with pytest.raises(WalletNotFoundError):
+            issue_bonus_bulk(
+                db=db_session,
+                recipients=[(seed_data["alice"].id, Decimal("10")), (carol.id, Decimal("10"))],
+                asset_type_id=seed_data["gc"].id,
+            )
 
-        assert result["transaction_type"] == "SPEND"
-        assert Decimal(result["balance_after"]) == Decimal("470")  # 500 - 30
 
+@pytest.mark.unit
+class TestSpend:
     def test_spend_rejects_insufficient_funds(self, db_session, seed_data):
         from app.service import spend
         with pytest.raises(InsufficientFundsError) as exc_info:
@@ -238,9 +289,9 @@ class TestSpend:
 
     def test_spend_balance_never_goes_negative(self, db_session, seed_data):
         """After a refused spend, wallet balance must be unchanged."""
+        from sqlalchemy import select
         from app.service import spend
-        alice_wallet_before = db_session.get(Wallet, seed_data["alice_wallet"].id)
-        balance_before = alice_wallet_before.balance
+        balance_before = seed_data["alice_wallet"].balance
 
         with pytest.raises(InsufficientFundsError):
             spend(
@@ -250,8 +301,12 @@ class TestSpend:
                 amount=Decimal("1000000"),
             )
 
-        db_session.refresh(alice_wallet_before)
-        assert alice_wallet_before.balance == balance_before
+        alice_wallet_after = db_session.execute(
+            select(Wallet)
+            .where(Wallet.id == seed_data["alice_wallet"].id)
+            .execution_options(populate_existing=True)
+        ).scalar_one()
+        assert alice_wallet_after.balance == balance_before
 
     def test_spend_credits_revenue_wallet(self, db_session, seed_data):
         from app.service import spend
@@ -269,15 +324,137 @@ class TestSpend:
         assert revenue_after == revenue_before + Decimal("100")
 
 
+@pytest.mark.unit
+class TestIdempotencyPurge:
+    def test_purge_removes_only_expired_keys(self, db_session, seed_data):
+        from datetime import datetime, timedelta, timezone
+        from app.models import IdempotencyKey
+        from app.service import purge_expired_idempotency_keys
+        now = datetime.now(timezone.utc)
+        db_session.add_all([
+            IdempotencyKey(key="expired", endpoint="top_up", response_body="{}",
+                           expires_at=now - timedelta(hours=1)),
+            IdempotencyKey(key="live", endpoint="top_up", response_body="{}",
+                           expires_at=now + timedelta(hours=1)),
+        ])
+        db_session.flush()
+
+        assert purge_expired_idempotency_keys(db_session) == 1
+        remaining = {k.key for k in db_session.query(IdempotencyKey).all()}
+        assert remaining == {"live"}
+
+
+@pytest.mark.unit
+class TestSystemWalletShards:
+    def test_spend_credits_a_revenue_shard(self, db_session, seed_data):
+        from app.config import settings
+        from app.service import ensure_system_wallet_shards, get_balance, spend
+        created = ensure_system_wallet_shards(db_session)
+        assert created == settings.SYSTEM_WALLET_SHARDS - 1
+        assert ensure_system_wallet_shards(db_session) == 0
+
+        spend(
+            db=db_session,
+            user_account_id=seed_data["alice"].id,
+            asset_type_id=seed_data["gc"].id,
+            amount=Decimal("100"),
+        )
+        db_session.flush()
+
+        # Alice's purchases land on a non-zero shard; the balance sums them.
+        assert db_session.get(Wallet, seed_data["revenue_wallet"].id).balance == Decimal("0")
+        balance, _, _ = get_balance(db_session, seed_data["revenue"].id, seed_data["gc"].id)
+        assert balance == Decimal("100")
+
+
+@pytest.mark.unit
+class TestEnsureWallet:
+    def test_returns_existing_or_creates(self, db_session, seed_data):
+        from app.service import _ensure_wallet
+        existing = _ensure_wallet(db_session, seed_data["alice"].id, seed_data["gc"].id)
+        assert existing.id == seed_data["alice_wallet"].id
+        assert existing.balance == Decimal("500")
+
+        dia = AssetType(name="Diamonds", symbol="DIA", is_active=True)
+        db_session.add(dia)
+        db_session.flush()
+        created = _ensure_wallet(db_session, seed_data["alice"].id, dia.id)
+        assert created.balance == Decimal("0")
+        assert _ensure_wallet(db_session, seed_data["alice"].id, dia.id).id == created.id
+
+
+@pytest.mark.unit
+class TestWriterSessions:
+    def test_entered_write_dependency_blocks_nobody(self):
+        import threading
+        from app.database import get_db, get_db_read
+        held = get_db()
+        next(held)  # a request that has its session but has not run SQL yet
+
+        entered = []
+
+        def enter_both():
+            for dependency in (get_db, get_db_read):
+                gen = dependency()
+                next(gen)
+                entered.append(dependency.__name__)
+                gen.close()
+
+        worker = threading.Thread(target=enter_both, daemon=True)
+        worker.start()
+        worker.join(timeout=5)
+        held.close()
+        assert entered == ["get_db", "get_db_read"]
+
+    def test_writer_connection_is_exclusive_until_commit(self):
+        import threading
+        from sqlalchemy import text
+        from app.database import get_db
+        held = get_db()
+        db = next(held)
+        db.execute(text("SELECT 1"))
+
+        done = threading.Event()
+
+        def other_writer():
+            gen = get_db()
+            other = next(gen)
+            other.execute(text("SELECT 1"))
+            other.commit()
+            done.set()
+            gen.close()
+
+        worker = threading.Thread(target=other_writer, daemon=True)
+        worker.start()
+        assert not done.wait(0.2)
+        db.commit()
+        worker.join(timeout=5)
+        held.close()
+        assert done.is_set()
+
+
+    def test_relaxed_commit_restores_synchronous_after_failed_commit(self):
+        from sqlalchemy import text
+        from app.database import engine, get_db_context, relaxed_commit
+        Base.metadata.create_all(bind=engine)
+        with pytest.raises(sqlalchemy.exc.IntegrityError):
+            with get_db_context() as db, relaxed_commit(db):
+                db.add(AssetType(name=None, symbol="XX"))
+
+        with get_db_context() as db:
+            assert db.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+
+
+@pytest.mark.unit
 class TestGetBalance:
     def test_get_balance_returns_correct_amount(self, db_session, seed_data):
         from app.service import get_balance
-        wallet, account, asset = get_balance(
+        balance, account, asset = get_balance(
             db=db_session,
             account_id=seed_data["alice"].id,
             asset_type_id=seed_data["gc"].id,
         )
-        assert wallet.balance == Decimal("500")
+        assert balance == Decimal("500")
         assert account.username == "alice"
         assert asset.symbol == "GC"
 
@@ -297,18 +474,29 @@ class TestGetBalance:
 # HTTP API tests (FastAPI TestClient)
 # ──────────────────────────────────────────────────────────────────────────────
 
+@pytest.fixture(scope="session")
+def _client():
+    """One TestClient, so the app's lifespan runs once for the whole suite."""
+    with TestClient(app) as c:
+        yield c
+
+
 @pytest.fixture()
-def client(db_session, seed_data):
+def client(_client, db_session, seed_data):
     """Override DB dependency with the test session."""
     def override_get_db():
         yield db_session
 
     app.dependency_overrides[get_db] = override_get_db
-    with TestClient(app) as c:
-        yield c
-    app.dependency_overrides.clear()
+    app.dependency_overrides[get_db_read] = override_get_db
+    invalidate_catalog_cache()
+    idempotency_cache.clear()
+    yield _client
+    app.dependency_overrides.pop(get_db, None)
+    app.dependency_overrides.pop(get_db_read, None)
 
 
+@pytest.mark.api
 class TestAPIHealth:
     def test_health(self, client):
         resp = client.get("/health")
@@ -316,6 +504,15 @@ class TestAPIHealth:
         assert resp.json()["status"] == "healthy"
 
 
+@pytest.mark.api
+class TestAPIPreflight:
+    def test_options_short_circuits(self, client):
+        resp = client.options("/wallet/topup")
+        assert resp.status_code == 200
+        assert resp.content == b""
+
+
+@pytest.mark.api
 class TestAPIBalance:
     def test_get_balance_ok(self, client, seed_data):
         resp = client.get(
@@ -332,6 +529,7 @@ class TestAPIBalance:
         assert resp.status_code == 404
 
 
+@pytest.mark.api
 class TestAPITopUp:
     def test_topup_ok(self, client, seed_data):
         resp = client.post("/wallet/topup", json={
@@ -359,7 +557,143 @@ class TestAPITopUp:
         assert r2.status_code in (200, 201)
         assert r1.json()["reference_id"] == r2.json()["reference_id"]
 
+    def test_replay_returns_original_body(self, client, seed_data):
+        key = f"test-{uuid.uuid4()}"
+        payload = {
+            "user_account_id": str(seed_data["alice"].id),
+            "asset_type_id": str(seed_data["gc"].id),
+            "amount": "7.5",
+        }
+        first = client.post("/wallet/spend", json=payload, headers={"Idempotency-Key": key})
+        replay = client.post("/wallet/spend", json=payload, headers={"Idempotency-Key": key})
+
+        assert first.status_code == 201
+        assert replay.status_code == 200
+        assert replay.json() == first.json()
+        assert first.json()["amount_minor"] == 75_000
 
+    def test_committed_key_is_cached_in_process(self, client, seed_data):
+        key = f"test-{uuid.uuid4()}"
+        resp = client.post("/wallet/topup", headers={"Idempotency-Key": key}, json={
+            "user_account_id": str(seed_data["alice"].id),
+            "asset_type_id": str(seed_data["gc"].id),
+            "amount": "5",
+        })
+        endpoint, body = idempotency_cache.lookup(key)
+        assert endpoint == "top_up"
+        assert json.loads(body) == resp.json()
+
+
+    def test_redis_layer_misses_then_serves_published_key(self, client, seed_data, monkeypatch):
+        class StubRedis:
+            def __init__(self):
+                self.store = {}
+
+            def get(self, name):
+                return self.store.get(name)
+
+            def pipeline(self, transaction=True):
+                return StubPipeline(self.store)
+
+        class StubPipeline:
+            def __init__(self, store):
+                self.store, self.ops = store, []
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def set(self, name, value, px=None, nx=False):
+                self.ops.append((name, value))
+
+            def execute(self):
+                for name, value in self.ops:
+                    self.store.setdefault(name, value.encode())
+
+        stub = StubRedis()
+        monkeypatch.setattr(idempotency_cache, "_client", stub)
+        key = f"test-{uuid.uuid4()}"
+        assert idempotency_cache.lookup(key) is None
+
+        resp = client.post("/wallet/topup", headers={"Idempotency-Key": key}, json={
+            "user_account_id": str(seed_data["alice"].id),
+            "asset_type_id": str(seed_data["gc"].id),
+            "amount": "5",
+        })
+        assert resp.status_code == 201
+        assert f"idem:{key}" in stub.store
+
+        idempotency_cache.clear()
+        endpoint, body = idempotency_cache.lookup(key)
+        assert endpoint == "top_up"
+        assert json.loads(body) == resp.json()
+
+@pytest.mark.api
+class TestAPITransactions:
+    def test_history_reports_total_and_asset(self, client, seed_data):
+        alice, gc = seed_data["alice"], seed_data["gc"]
+        for amount in ("10", "20"):
+            client.post("/wallet/topup", json={
+                "user_account_id": str(alice.id),
+                "asset_type_id": str(gc.id),
+                "amount": amount,
+            })
+
+        resp = client.get(f"/wallet/transactions/{alice.id}/{gc.id}?limit=1")
+        assert resp.status_code == 200
+        data = resp.json()
+        assert data["asset_type"] == "Gold Coins"
+        assert data["total"] == 2
+        assert len(data["transactions"]) == 1
+        first_page = data["transactions"]
+        assert first_page[0]["transaction_type"] == "TOPUP"
+        assert Decimal(first_page[0]["amount"]) == Decimal("20")
+
+        resp = client.get(
+            f"/wallet/transactions/{alice.id}/{gc.id}",
+            params={"limit": 1, "cursor": data["next_cursor"]},
+        )
+        data = resp.json()
+        assert data["total"] == 2
+        assert len(data["transactions"]) == 1
+        assert data["transactions"][0]["id"] != first_page[0]["id"]
+        assert data["next_cursor"] is None
+
+    def test_history_empty_wallet(self, client, seed_data):
+        alice, gc = seed_data["alice"], seed_data["gc"]
+        resp = client.get(f"/wallet/transactions/{alice.id}/{gc.id}")
+        assert resp.status_code == 200
+        data = resp.json()
+        assert data["total"] == 0
+        assert data["transactions"] == []
+        assert data["next_cursor"] is None
+
+    def test_history_rejects_bad_cursor(self, client, seed_data):
+        alice, gc = seed_data["alice"], seed_data["gc"]
+        resp = client.get(f"/wallet/transactions/{alice.id}/{gc.id}?cursor=not-a-cursor")
+        assert resp.status_code == 400
+        assert resp.json()["detail"]["code"] == "INVALID_CURSOR"
+
+    def test_history_unknown_account(self, client, seed_data):
+        resp = client.get(f"/wallet/transactions/{uuid.uuid4()}/{seed_data['gc'].id}")
+        assert resp.status_code == 404
+        assert resp.json()["detail"]["code"] == "ACCOUNT_NOT_FOUND"
+
+
+@pytest.mark.api
+class TestAPICatalog:
+    def test_account_list_refreshes_after_register(self, client, seed_data):
+        resp = client.get("/wallet/accounts")
+        assert [a["username"] for a in resp.json()] == ["alice"]
+
+        client.post("/auth/register", json={"username": "bob", "password": "secret1"})
+        resp = client.get("/wallet/accounts")
+        assert sorted(a["username"] for a in resp.json()) == ["alice", "bob"]
+
+
+@pytest.mark.api
 class TestAPISpend:
     def test_spend_ok(self, client, seed_data):
         resp = client.post("/wallet/spend", json={
@@ -381,6 +715,48 @@ class TestAPISpend:
         assert resp.json()["detail"]["code"] == "INSUFFICIENT_FUNDS"
 
 
+@pytest.mark.api
+class TestAPIRequestBodies:
+    def test_topup_with_amount_minor(self, client, seed_data):
+        resp = client.post("/wallet/topup", json={
+            "user_account_id": str(seed_data["alice"].id),
+            "asset_type_id": str(seed_data["gc"].id),
+            "amount_minor": 1_250_000,
+        })
+        assert resp.status_code == 201
+        data = resp.json()
+        assert Decimal(data["amount"]) == Decimal("125")
+        assert data["amount_minor"] == 1_250_000
+        assert data["balance_after_minor"] == 6_250_000
+
+    def test_amount_and_amount_minor_are_exclusive(self, client, seed_data):
+        resp = client.post("/wallet/topup", json={
+            "user_account_id": str(seed_data["alice"].id),
+            "asset_type_id": str(seed_data["gc"].id),
+            "amount": "1",
+            "amount_minor": 10_000,
+        })
+        assert resp.status_code == 422
+
+    def test_amount_minor_above_numeric_range_is_rejected(self, client, seed_data):
+        resp = client.post("/wallet/topup", json={
+            "user_account_id": str(seed_data["alice"].id),
+            "asset_type_id": str(seed_data["gc"].id),
+            "amount_minor": 10**30,
+        })
+        assert resp.status_code == 422
+
+    def test_unknown_request_fields_are_rejected(self, client, seed_data):
+        resp = client.post("/wallet/spend", json={
+            "user_account_id": str(seed_data["alice"].id),
+            "asset_type_id": str(seed_data["gc"].id),
+            "amount": "1",
+            "ammount": "1000",
+        })
+        assert resp.status_code == 422
+
+
+@pytest.mark.api
 class TestAPIBonus:
     def test_bonus_ok(self, client, seed_data):
         resp = client.post("/wallet/bonus", json={
@@ -393,3 +769,65 @@ class TestAPIBonus:
         data = resp.json()
         assert data["transaction_type"] == "BONUS"
         assert float(data["balance_after"]) == 525.0
+
+
+@pytest.mark.api
+class TestAPIBonusBulk:
+    def test_bulk_bonus_ok(self, client, seed_data):
+        resp = client.post("/wallet/bonus/bulk", json={
+            "asset_type_id": str(seed_data["gc"].id),
+            "recipients": [
+                {"user_account_id": str(seed_data["alice"].id), "amount": "25"},
+            ],
+            "reason": "Launch gift",
+        })
+        assert resp.status_code == 201
+        data = resp.json()
+        assert data["transaction_type"] == "BONUS"
+        assert data["recipients"][0]["balance_after"] == "525.0000"
+
+    def test_bulk_bonus_rejects_empty_recipients(self, client, seed_data):
+        resp = client.post("/wallet/bonus/bulk", json={
+            "asset_type_id": str(seed_data["gc"].id),
+            "recipients": [],
+        })
+        assert resp.status_code == 422
+
+
+@pytest.mark.api
+class TestAPIAuth:
+    def test_login_upgrades_legacy_bcrypt_hash(self, client, db_session, seed_data):
+        import bcrypt
+        alice = seed_data["alice"]
+        alice.hashed_password = bcrypt.hashpw(b"secret1", bcrypt.gensalt()).decode()
+        db_session.flush()
+
+        resp = client.post("/auth/login", json={"username": "alice", "password": "secret1"})
+        assert resp.status_code == 200
+        db_session.refresh(alice)
+        assert alice.hashed_password.startswith("$argon2id$")
+
+        resp = client.post("/auth/login", json={"username": "alice", "password": "secret1"})
+        assert resp.status_code == 200
+
+    def test_register_reports_which_field_is_taken(self, client, seed_data):
+        resp = client.post("/auth/register", json={
+            "username": "alice", "email": "alice@test.com", "password": "secret1",
+        })
+        assert resp.status_code == 409
+        assert resp.json()["detail"]["code"] == "USERNAME_TAKEN"
+
+        resp = client.post("/auth/register", json={
+            "username": "alice2", "email": "alice@test.com", "password": "secret1",
+        })
+        assert resp.status_code == 409
+        assert resp.json()["detail"]["code"] == "EMAIL_TAKEN"
+
+    def test_register_creates_empty_wallets(self, client, seed_data):
+        resp = client.post("/auth/register", json={"username": "bob", "password": "secret1"})
+        assert resp.status_code == 201
+        account_id = resp.json()["account_id"]
+
+        resp = client.get(f"/wallet/balance/{account_id}/{seed_data['gc'].id}")
+        assert resp.status_code == 200
+        assert float(resp.json()["balance"]) == 0.0